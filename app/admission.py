@@ -0,0 +1,157 @@
+import asyncio
+import itertools
+import math
+from dataclasses import dataclass, field
+from fastapi.responses import JSONResponse
+from app import settings
+
+
+"""Admission control: bounds concurrent requests per route class before they wait for a DB connection"""
+# served from files without a DB connection, long downloads must not hold DB-sized slots
+EXEMPT_PATHS = ('/api/v1/books/snapshot',)
+
+
+class Rejected(Exception):
+    pass
+
+
+@dataclass
+class RouteClass:
+    name: str
+    prefixes: tuple[str, ...]
+    priority: int  # lower is served first
+    max_concurrency: int
+    max_queue: int
+    max_wait: float
+    active: int = 0
+    queued: int = 0
+    admitted: int = 0
+    rejected_queue_full: int = 0
+    rejected_deadline: int = 0
+
+    def stats(self) -> dict:
+        return {'active': self.active, 'queued': self.queued, 'admitted': self.admitted,
+                'rejected_queue_full': self.rejected_queue_full, 'rejected_deadline': self.rejected_deadline,
+                'max_concurrency': self.max_concurrency, 'max_queue': self.max_queue}
+
+
+@dataclass(order=True)
+class Waiter:
+    priority: int
+    sequence: int
+    route_class: RouteClass = field(compare=False)
+    future: asyncio.Future = field(compare=False)
+
+
+class AdmissionController:
+    """
+    Shared limit for all classes plus a limit per class. When a slot is freed
+    waiters are granted in priority order, so librarian desk operations overtake catalogue browsing
+    """
+
+    def __init__(self, max_concurrency: int, classes: list[RouteClass]):
+        self.max_concurrency = max_concurrency
+        self.classes = classes
+        self.active = 0
+        self.waiters: list[Waiter] = []
+        self.sequence = itertools.count()
+
+    def classify(self, path: str) -> RouteClass | None:
+        if path in EXEMPT_PATHS:
+            return
+        for route_class in self.classes:
+            if path.startswith(route_class.prefixes):
+                return route_class
+
+    def can_run(self, route_class: RouteClass) -> bool:
+        return self.active < self.max_concurrency and route_class.active < route_class.max_concurrency
+
+    def grant(self, route_class: RouteClass):
+        self.active += 1
+        route_class.active += 1
+        route_class.admitted += 1
+
+    async def acquire(self, route_class: RouteClass):
+        # release() hands freed slots to waiters synchronously, so a runnable request never barges ahead of them
+        if self.can_run(route_class):
+            self.grant(route_class)
+            return
+        if route_class.queued >= route_class.max_queue:
+            route_class.rejected_queue_full += 1
+            raise Rejected
+        waiter = Waiter(route_class.priority, next(self.sequence), route_class,
+                        asyncio.get_running_loop().create_future())
+        self.waiters.append(waiter)
+        route_class.queued += 1
+        try:
+            await asyncio.wait_for(asyncio.shield(waiter.future), route_class.max_wait)
+        except asyncio.TimeoutError:
+            if waiter.future.done():
+                return
+            route_class.rejected_deadline += 1
+            raise Rejected
+        except asyncio.CancelledError:
+            if waiter.future.done() and not waiter.future.cancelled():
+                self.release(route_class)
+            raise
+        finally:
+            if not waiter.future.done():
+                waiter.future.cancel()
+            if waiter in self.waiters:
+                self.waiters.remove(waiter)
+                route_class.queued -= 1
+
+    def release(self, route_class: RouteClass):
+        self.active -= 1
+        route_class.active -= 1
+        for waiter in sorted(self.waiters):
+            if self.active >= self.max_concurrency:
+                break
+            if waiter.future.done() or not self.can_run(waiter.route_class):
+                continue
+            self.waiters.remove(waiter)
+            waiter.route_class.queued -= 1
+            self.grant(waiter.route_class)
+            waiter.future.set_result(None)
+
+    def stats(self) -> dict:
+        return {'active': self.active, 'max_concurrency': self.max_concurrency,
+                'classes': {route_class.name: route_class.stats() for route_class in self.classes}}
+
+
+def default_controller() -> AdmissionController:
+    total = settings.ADMISSION_MAX_CONCURRENCY
+    queue = settings.ADMISSION_QUEUE_SIZE
+    wait = settings.ADMISSION_MAX_WAIT
+    return AdmissionController(total, [
+        RouteClass('librarian', ('/api/v1/librarian',), 0, total, queue, wait),
+        RouteClass('write', ('/api/v1/user', '/api/v1/admin'), 1, max(1, total // 2), queue, wait),
+        RouteClass('login', ('/authorization',), 1, max(1, total // 4), queue, wait),
+        RouteClass('read', ('/api/v1/books',), 2, max(1, total * 3 // 4), queue, wait),
+    ])
+
+
+controller = default_controller()
+
+
+class AdmissionMiddleware:
+    """ASGI middleware answering 503 with Retry-After when a class queue is full or wait exceeds its deadline"""
+
+    def __init__(self, app, admission_controller: AdmissionController = controller):
+        self.app = app
+        self.controller = admission_controller
+
+    async def __call__(self, scope, receive, send):
+        route_class = self.controller.classify(scope['path']) if scope['type'] == 'http' else None
+        if route_class is None:
+            return await self.app(scope, receive, send)
+        try:
+            await self.controller.acquire(route_class)
+        except Rejected:
+            response = JSONResponse({'detail': 'Server is overloaded'}, status_code=503,
+                                    headers={'Retry-After': str(math.ceil(route_class.max_wait))})
+            return await response(scope, receive, send)
+        try:
+            await self.app(scope, receive, send)
+        finally:
+            self.controller.release(route_class)
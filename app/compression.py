@@ -0,0 +1,183 @@
+import gzip
+import hashlib
+import time
+from collections import OrderedDict
+from starlette.datastructures import Headers, MutableHeaders
+from app import settings
+
+try:
+    import brotli
+except ImportError:
+    brotli = None
+
+
+"""Negotiated gzip/brotli compression of JSON responses with a cache of compressed variants"""
+COMPRESSIBLE_TYPES = ('application/json', 'application/x-ndjson', 'text/')
+
+
+def available_encodings() -> tuple[str, ...]:
+    """Server preference order"""
+    return ('br', 'gzip') if brotli is not None else ('gzip',)
+
+
+def negotiate(accept_encoding: str) -> str | None:
+    """
+    Picks encoding from Accept-Encoding by q-value, ties broken by server preference
+    :param accept_encoding: Accept-Encoding header value
+    :return: 'br', 'gzip' or None for identity
+    """
+    weights = {}
+    for item in accept_encoding.split(','):
+        name, _, params = item.strip().partition(';')
+        quality = 1.0
+        params = params.strip()
+        if params.startswith('q='):
+            try:
+                quality = float(params[2:])
+            except ValueError:
+                quality = 0.0
+        if name:
+            weights[name.strip().lower()] = quality
+    wildcard = weights.get('*', 0.0)
+    candidates = [(weights.get(encoding, wildcard), -position, encoding)
+                  for position, encoding in enumerate(available_encodings())]
+    quality, _, encoding = max(candidates)
+    return encoding if quality > 0 else None
+
+
+def compress(body: bytes, encoding: str) -> bytes:
+    if encoding == 'br':
+        return brotli.compress(body, quality=settings.COMPRESSION_BROTLI_QUALITY)
+    # mtime=0 keeps output identical for identical bodies
+    return gzip.compress(body, compresslevel=settings.COMPRESSION_GZIP_LEVEL, mtime=0)
+
+
+class CompressedCache:
+    """
+    LRU of compressed variants keyed by encoding and digest of the uncompressed body,
+    so a changed payload never gets a stale variant and no invalidation is needed
+    """
+
+    def __init__(self, max_bytes: int):
+        self.max_bytes = max_bytes
+        self.size = 0
+        self.items: OrderedDict[tuple[str, bytes], bytes] = OrderedDict()
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, key: tuple[str, bytes]) -> bytes | None:
+        body = self.items.get(key)
+        if body is None:
+            self.misses += 1
+            return
+        self.hits += 1
+        self.items.move_to_end(key)
+        return body
+
+    def put(self, key: tuple[str, bytes], body: bytes):
+        if len(body) > self.max_bytes or key in self.items:
+            return
+        self.items[key] = body
+        self.size += len(body)
+        while self.size > self.max_bytes:
+            _, evicted = self.items.popitem(last=False)
+            self.size -= len(evicted)
+
+    def stats(self) -> dict:
+        return {'entries': len(self.items), 'bytes': self.size, 'max_bytes': self.max_bytes,
+                'hits': self.hits, 'misses': self.misses}
+
+
+class CompressionStats:
+    def __init__(self):
+        self.responses = 0
+        self.bytes_in = 0
+        self.bytes_out = 0
+        self.compress_seconds = 0.0
+
+    def record(self, bytes_in: int, bytes_out: int):
+        self.responses += 1
+        self.bytes_in += bytes_in
+        self.bytes_out += bytes_out
+
+    def stats(self) -> dict:
+        return {'responses': self.responses, 'bytes_in': self.bytes_in, 'bytes_out': self.bytes_out,
+                'ratio': round(self.bytes_out / self.bytes_in, 4) if self.bytes_in else None,
+                'compress_seconds': round(self.compress_seconds, 6)}
+
+
+cache = CompressedCache(settings.COMPRESSION_CACHE_MAX_BYTES)
+counters = CompressionStats()
+
+
+def is_cacheable(request_headers: Headers, response_headers: Headers, method: str) -> bool:
+    """Public responses only: no credentials in the request, nothing private in the response"""
+    if method not in ('GET', 'HEAD') or 'authorization' in request_headers or 'cookie' in request_headers:
+        return False
+    cache_control = response_headers.get('cache-control', '').lower()
+    return 'private' not in cache_control and 'no-store' not in cache_control and 'set-cookie' not in response_headers
+
+
+def get_stats() -> dict:
+    return {'encodings': list(available_encodings()), 'min_size': settings.COMPRESSION_MIN_SIZE,
+            **counters.stats(), 'cache': cache.stats()}
+
+
+class CompressionMiddleware:
+    """
+    ASGI middleware compressing complete JSON bodies above COMPRESSION_MIN_SIZE.
+    Streaming responses without Content-Length and already encoded responses pass through untouched
+    """
+
+    def __init__(self, app, compressed_cache: CompressedCache = cache):
+        self.app = app
+        self.cache = compressed_cache
+
+    async def __call__(self, scope, receive, send):
+        if scope['type'] != 'http':
+            return await self.app(scope, receive, send)
+        request_headers = Headers(scope=scope)
+        encoding = negotiate(request_headers.get('accept-encoding', ''))
+        if encoding is None:
+            return await self.app(scope, receive, send)
+
+        start_message = None
+        passthrough = False
+        chunks = []
+
+        async def send_compressed(message):
+            nonlocal start_message, passthrough
+            if message['type'] == 'http.response.start':
+                start_message = message
+                headers = Headers(raw=message['headers'])
+                content_length = headers.get('content-length')
+                passthrough = (message['status'] != 200 or 'content-encoding' in headers
+                               or content_length is None or int(content_length) < settings.COMPRESSION_MIN_SIZE
+                               or not headers.get('content-type', '').startswith(COMPRESSIBLE_TYPES))
+                if passthrough:
+                    await send(message)
+                return
+            if passthrough or message['type'] != 'http.response.body':
+                return await send(message)
+            chunks.append(message.get('body', b''))
+            if message.get('more_body', False):
+                return
+            body = b''.join(chunks)
+            headers = MutableHeaders(raw=start_message['headers'])
+            cacheable = is_cacheable(request_headers, headers, scope['method'])
+            key = (encoding, hashlib.blake2b(body, digest_size=16).digest())
+            compressed = self.cache.get(key) if cacheable else None
+            if compressed is None:
+                started = time.perf_counter()
+                compressed = compress(body, encoding)
+                counters.compress_seconds += time.perf_counter() - started
+                if cacheable:
+                    self.cache.put(key, compressed)
+            counters.record(len(body), len(compressed))
+            headers['content-encoding'] = encoding
+            headers['content-length'] = str(len(compressed))
+            headers.add_vary_header('Accept-Encoding')
+            await send(start_message)
+            await send({'type': 'http.response.body', 'body': compressed})
+
+        await self.app(scope, receive, send_compressed)
@@ -0,0 +1,91 @@
+import asyncio
+from bisect import bisect_left
+from databases.core import Connection
+from app import settings
+from app.db import notifications
+from app.schemas import miscs
+from app.crud.memory import repository_method
+from app.crud.misc import database
+
+
+"""Prefix and trigram suggestions for authors, genres and publishers names"""
+TABLES = ('authors', 'genres', 'publishers')
+indexes: dict[str, list[tuple[str, int, str]]] = {}
+stale: set[str] = set(TABLES)
+reload_lock = asyncio.Lock()
+
+
+def on_names_changed(payload: str):
+    if payload in TABLES:
+        stale.add(payload)
+    elif not payload:
+        stale.update(TABLES)
+
+
+notifications.subscribe(notifications.NAMES_CHANNEL, on_names_changed)
+
+
+def escape_like(value: str) -> str:
+    return value.replace('\\', '\\\\').replace('%', '\\%').replace('_', '\\_')
+
+
+async def load_index(table: str):
+    """
+    Loads table names sorted by lowercased name, rebuilt after NAMES_CHANNEL notification.
+    Always reads the primary: the notification comes from it and a lagging replica could miss the new name
+    """
+    async with reload_lock:
+        if table not in stale:
+            return
+        stale.discard(table)
+        try:
+            async with database.connection() as session:
+                result = await session.fetch_all(query=f'''SELECT id, name FROM {table} WHERE name IS NOT NULL;''')
+        except BaseException:
+            stale.add(table)
+            raise
+        indexes[table] = sorted((item.name.lower(), item.id, item.name) for item in result)
+
+
+@repository_method
+async def suggest_by_prefix(table: str, prefix: str, limit: int, session: Connection) -> list[miscs.Suggestion]:
+    """
+    Names starting with prefix, case-insensitive
+    :param table: one of TABLES
+    :param prefix: typed text
+    :param limit: max number of suggestions
+    :param session: DB connection session
+    :return: list[schemas.Suggestion] ordered by name
+    """
+    prefix = prefix.lower()
+    if settings.AUTOCOMPLETE_IN_MEMORY:
+        if table in stale:
+            await load_index(table)
+        index = indexes[table]
+        suggestions = []
+        for position in range(bisect_left(index, (prefix,)), len(index)):
+            name_lower, item_id, name = index[position]
+            if len(suggestions) >= limit or not name_lower.startswith(prefix):
+                break
+            suggestions.append(miscs.Suggestion(id=item_id, name=name))
+        return suggestions
+    query = f'''SELECT id, name FROM {table} WHERE lower(name) LIKE :prefix
+    ORDER BY lower(name) LIMIT :limit;'''
+    result = await session.fetch_all(query=query, values={'prefix': escape_like(prefix) + '%', 'limit': limit})
+    return [miscs.Suggestion.from_orm(item) for item in result]
+
+
+@repository_method
+async def suggest_similar(table: str, text: str, limit: int, session: Connection) -> list[miscs.Suggestion]:
+    """
+    Names similar to text, tolerant to typos, served by the trigram index
+    :param table: one of TABLES
+    :param text: typed text
+    :param limit: max number of suggestions
+    :param session: DB connection session
+    :return: list[schemas.Suggestion] ordered by similarity
+    """
+    query = f'''SELECT id, name FROM {table} WHERE name % :text
+    ORDER BY similarity(name, :text) DESC, name LIMIT :limit;'''
+    result = await session.fetch_all(query=query, values={'text': text, 'limit': limit})
+    return [miscs.Suggestion.from_orm(item) for item in result]
@@ -1,50 +1,323 @@
+from time import time
+from typing import AsyncGenerator
 from databases.core import Connection
 import databases.backends.postgres
+from app import settings
 from app.schemas import books
+from app.crud.singleflight import single_flight
+from app.db import notifications
+from app.crud.memory import repository_method
 
 
 databases.backends.postgres.Record.__iter__ = lambda self: iter(self._row)
 
 
-async def get_book_by_id(book_id: int, session: Connection) -> books.Book:
-    query = '''SELECT * FROM books WHERE id = :id'''
-    result = await session.fetch_one(query=query, values={'id': book_id})
-    return books.Book.from_orm(result) if result else None
+# schemas.Book field -> books column
+BOOK_COLUMNS = {'id': 'id', 'name': 'name', 'author_id': 'author_id', 'publisher_id': 'publisher_id',
+                'genre_id': 'genre_id', 'reserved_datetime': 'reserved_datetime', 'reserved_user_id': 'reserver_id',
+                'in_stock': 'in_stock', 'owner_id': 'owner_id', 'loaned_datetime': 'loaned_datetime',
+                'due_datetime': 'due_datetime'}
+FILTER_COLUMNS = ('genre_id', 'author_id', 'publisher_id')
+
+
+def select_columns(fields: tuple[str, ...] = None) -> str:
+    """SELECT list for the requested schemas.Book fields, all fields if None"""
+    return ', '.join(f'{BOOK_COLUMNS[field]} AS {field}' if BOOK_COLUMNS[field] != field else field
+                     for field in (fields or BOOK_COLUMNS))
+
+
+def to_book(item, fields: tuple[str, ...] = None) -> books.Book | dict:
+    """schemas.Book for full rows, plain dict of requested fields otherwise.
+    Accepts both databases and native asyncpg records"""
+    row = getattr(item, '_mapping', item)
+    return books.Book(**row) if fields is None else dict(row.items())
 
 
+@single_flight('book_id', 'fields')
+@repository_method
+async def get_book_by_id(book_id: int, session: Connection, fields: tuple[str, ...] = None) -> books.Book | dict:
+    # hot path: native asyncpg call, the statement is prepared once per connection and cached
+    query = f'''SELECT {select_columns(fields)} FROM books WHERE id = $1'''
+    result = await session.raw_connection.fetchrow(query, book_id)
+    return to_book(result, fields) if result else None
+
+
+@repository_method
 async def get_book_by_name(book_name: str, session: Connection) -> books.Book:
-    query = '''SELECT * FROM books WHERE name = :name'''
+    query = f'''SELECT {select_columns()} FROM books WHERE name = :name'''
     result = await session.fetch_one(query=query, values={'name': book_name})
     return books.Book.from_orm(result) if result else None
 
 
+@repository_method
+async def get_books_by_ids(book_ids: list[int], session: Connection,
+                           fields: tuple[str, ...] = None) -> list[books.Book | dict | None]:
+    """Returns books in the order of given ids, None for ids that don't exist"""
+    query_fields = fields if fields is None or 'id' in fields else ('id',) + fields
+    query = f'''SELECT {select_columns(query_fields)} FROM books WHERE id = ANY(:ids);'''
+    result = await session.fetch_all(query=query, values={'ids': list(set(book_ids))})
+    found = {item.id: to_book(item, fields) for item in result}
+    if query_fields != fields:
+        for book in found.values():
+            del book['id']
+    return [found.get(book_id) for book_id in book_ids]
+
+
+@single_flight('filter_name', 'filter_value', 'fields')
+@repository_method
 async def search_books(session: Connection, filter_name: str = None,
-                       filter_value: int = None) -> list[books.Book]:
+                       filter_value: int = None, fields: tuple[str, ...] = None) -> list[books.Book | dict]:
     if filter_name and filter_value:
-        query = '''SELECT * FROM books WHERE :filter_name = :value;'''
-        result = await session.fetch_all(query=query, values={'value': filter_value, 'filter_name': filter_name})
+        if filter_name not in FILTER_COLUMNS:
+            raise ValueError(f'Unsupported filter {filter_name}')
+        query = f'''SELECT {select_columns(fields)} FROM books WHERE {filter_name} = $1;'''
+        result = await session.raw_connection.fetch(query, filter_value)
     else:
-        query = '''SELECT * FROM books;'''
-        result = await session.fetch_all(query=query)
-    result = [books.Book.from_orm(item) for item in result]
+        query = f'''SELECT {select_columns(fields)} FROM books;'''
+        result = await session.raw_connection.fetch(query)
+    result = [to_book(item, fields) for item in result]
     return result
 
 
+@repository_method
+async def get_books_by_owner(owner_id: int, session: Connection) -> list[books.Book]:
+    """Books currently given to the user, served by ix_books_owner_id"""
+    query = f'''SELECT {select_columns()} FROM books WHERE owner_id = :owner_id AND in_stock = FALSE;'''
+    result = await session.fetch_all(query=query, values={'owner_id': owner_id})
+    return [books.Book.from_orm(item) for item in result]
+
+
+@repository_method
+async def get_books_by_reserver(reserver_id: int, session: Connection) -> list[books.Book]:
+    """Books with an active reservation by the user, served by ix_books_reserver_id"""
+    query = f'''SELECT {select_columns()} FROM books
+    WHERE reserver_id = :reserver_id AND reserved_datetime > :reserved_after;'''
+    values = {'reserver_id': reserver_id, 'reserved_after': int(time()) - settings.reservation_time}
+    result = await session.fetch_all(query=query, values=values)
+    return [books.Book.from_orm(item) for item in result]
+
+
+@repository_method
+async def iterate_overdue_loans(now: int, session: Connection) -> AsyncGenerator[books.OverdueLoan, None]:
+    """
+    Streams outstanding loans due before now with borrower contacts from a server-side cursor,
+    served by ix_books_due_outstanding
+    :param now: unix time
+    :param session: DB connection session
+    :return: schemas.OverdueLoan ordered by due date
+    """
+    query = '''SELECT b.id AS book_id, b.name AS book_name, u.id AS user_id, u.login, u.email,
+    b.loaned_datetime, b.due_datetime FROM books b JOIN users u ON u.id = b.owner_id
+    WHERE b.in_stock = FALSE AND b.due_datetime < :now ORDER BY b.due_datetime, b.id;'''
+    async for item in session.iterate(query=query, values={'now': now}):
+        yield books.OverdueLoan.from_orm(item)
+
+
+FACET_COLUMNS = ('genre_id', 'author_id', 'publisher_id', 'in_stock')
+FACETS_LOCK_KEY = 7_130_222
+
+
+def facet_deltas(deltas: dict, row, sign: int):
+    """Adds +1/-1 for every facet value of the book row"""
+    if row is None:
+        return
+    for column in FACET_COLUMNS:
+        value = row[column]
+        if value is None:
+            continue
+        key = (column, int(value))
+        deltas[key] = deltas.get(key, 0) + sign
+
+
+async def apply_facet_deltas(deltas: dict, session: Connection):
+    query = '''INSERT INTO book_facets (facet, value_id, count) VALUES ($1, $2, $3)
+    ON CONFLICT (facet, value_id) DO UPDATE SET count = book_facets.count + EXCLUDED.count;'''
+    # rows are always locked in the same order, otherwise concurrent give and take deadlock on in_stock counters
+    values = [(facet, value_id, delta) for (facet, value_id), delta in sorted(deltas.items()) if delta]
+    if values:
+        await session.raw_connection.executemany(query, values)
+
+
+@repository_method
+async def rebuild_facets(session: Connection):
+    """Recounts book_facets from scratch, for data loaded bypassing insert_book"""
+    async with session.transaction():
+        await session.execute('''DELETE FROM book_facets;''')
+        for column in FACET_COLUMNS:
+            query = f'''INSERT INTO book_facets (facet, value_id, count)
+            SELECT '{column}', {column}::int, COUNT(*) FROM books WHERE {column} IS NOT NULL GROUP BY {column};'''
+            await session.execute(query)
+
+
+async def ensure_facets(session: Connection) -> bool:
+    """
+    Rebuilds book_facets at startup when its availability counters don't add up to the number of books:
+    the table is created empty on a database that already has books, and deltas never correct that.
+    Runs under an advisory lock, so only one worker recounts
+    :param session: DB connection session
+    :return: True if the aggregates were rebuilt
+    """
+    query = '''SELECT (SELECT COUNT(in_stock) FROM books) AS books,
+    (SELECT COALESCE(SUM(count), 0) FROM book_facets WHERE facet = 'in_stock') AS counted;'''
+    async with session.transaction():
+        await session.execute('''SELECT pg_advisory_xact_lock(:key);''', {'key': FACETS_LOCK_KEY})
+        row = await session.fetch_one(query)
+        if row.books == row.counted:
+            return False
+        # writers of other workers apply their deltas after the recount commits, on top of it
+        await session.execute('''LOCK TABLE book_facets IN EXCLUSIVE MODE;''')
+        await rebuild_facets(session)
+    return True
+
+
+@single_flight()
+@repository_method
+async def get_facets(session: Connection) -> books.Facets:
+    """Counts per genre, author, publisher and availability read from book_facets aggregates"""
+    query = '''SELECT f.facet, f.value_id, f.count, COALESCE(g.name, a.name, p.name) AS name
+    FROM book_facets f
+    LEFT JOIN genres g ON f.facet = 'genre_id' AND g.id = f.value_id
+    LEFT JOIN authors a ON f.facet = 'author_id' AND a.id = f.value_id
+    LEFT JOIN publishers p ON f.facet = 'publisher_id' AND p.id = f.value_id
+    WHERE f.count > 0 ORDER BY f.count DESC;'''
+    result = await session.fetch_all(query=query)
+    facets = books.Facets()
+    for item in result:
+        if item.facet == 'in_stock':
+            if item.value_id:
+                facets.in_stock = item.count
+            else:
+                facets.given_out = item.count
+            continue
+        getattr(facets, item.facet.removesuffix('_id') + 's').append(
+            books.FacetCount(id=item.value_id, name=item.name, count=item.count))
+    return facets
+
+
+@repository_method
+async def get_book_changes(since: tuple[int, int], limit: int, session: Connection) -> books.BookChanges:
+    """
+    Books changed and deleted after the cursor, served by ix_books_change_xid_seq
+    and ix_book_tombstones_change_xid_seq.
+    Changes are ordered by writer transaction id and only those below the oldest running transaction are returned:
+    any transaction committing later has a bigger id, so a client never steps over a change committed late
+    :param since: (change_xid, change_seq) of the last change the client has, (0, 0) for the whole catalogue
+    :param limit: max number of changes
+    :param session: DB connection session
+    :return: schemas.BookChanges in change order, next_cursor to pass as since
+    """
+    values = {'since_xid': since[0], 'since_seq': since[1], 'limit': limit + 1}
+    query = f'''SELECT change_xid, change_seq, {select_columns()} FROM books
+    WHERE (change_xid, change_seq) > (CAST(:since_xid AS xid8), :since_seq)
+    AND change_xid < pg_snapshot_xmin(pg_current_snapshot())
+    ORDER BY change_xid, change_seq LIMIT :limit;'''
+    updated = await session.fetch_all(query=query, values=values)
+    query = '''SELECT change_xid, change_seq, book_id FROM book_tombstones
+    WHERE (change_xid, change_seq) > (CAST(:since_xid AS xid8), :since_seq)
+    AND change_xid < pg_snapshot_xmin(pg_current_snapshot())
+    ORDER BY change_xid, change_seq LIMIT :limit;'''
+    deleted = await session.fetch_all(query=query, values=values)
+    changes = sorted([(item.change_xid, books.BookChange(seq=item.change_seq, id=item.id, deleted=False,
+                                                         book=to_book(item))) for item in updated] +
+                     [(item.change_xid, books.BookChange(seq=item.change_seq, id=item.book_id, deleted=True))
+                      for item in deleted],
+                     key=lambda change: (change[0], change[1].seq))
+    has_more = len(changes) > limit
+    changes = changes[:limit]
+    last_xid, last_change = changes[-1] if changes else (since[0], None)
+    next_cursor = books.BookChanges.make_cursor(last_xid, last_change.seq if last_change else since[1])
+    return books.BookChanges(changes=[change for _, change in changes], next_cursor=next_cursor, has_more=has_more)
+
+
+@repository_method
 async def insert_book(book_data: books.NewBookData, session: Connection):
     query = '''INSERT INTO books(name, author_id, publisher_id, genre_id) 
-    VALUES(:name, :author_id, :publisher_id, :genre_id);'''
+    VALUES(:name, :author_id, :publisher_id, :genre_id) RETURNING author_id, publisher_id, genre_id, in_stock;'''
     values = book_data.dict(exclude={'author': True, 'publisher': True, 'genre': True})
-    await session.execute(query=query, values=values)
+    async with session.transaction():
+        row = await session.fetch_one(query=query, values=values)
+        deltas = {}
+        facet_deltas(deltas, row, 1)
+        await apply_facet_deltas(deltas, session)
+        await notifications.notify(notifications.BOOKS_CHANNEL, session)
 
 
+@repository_method
 async def update_book(book_data: books.Book, session: Connection):
-    query = '''UPDATE books SET name = :name, author_id = :author_id, publisher_id = :publisher_id,
-    genre_id = :genre_id, reserved_datetime = :reserved_datetime, reserver_id = :reserved_user_id,
-    in_stock = :in_stock, owner_id = :owner_id WHERE id = :id;'''
-    values = book_data.dict()
-    await session.execute(query=query, values=values)
+    # hot path for reservations and loans: native asyncpg calls with cached prepared statements
+    query = '''UPDATE books SET name = $2, author_id = $3, publisher_id = $4, genre_id = $5,
+    reserved_datetime = $6, reserver_id = $7, in_stock = $8, owner_id = $9, loaned_datetime = $10, due_datetime = $11,
+    change_seq = nextval('book_changes_seq'), change_xid = pg_current_xact_id()
+    WHERE id = $1 RETURNING author_id, publisher_id, genre_id, in_stock;'''
+    connection = session.raw_connection
+    async with session.transaction():
+        old_row = await connection.fetchrow(
+            '''SELECT author_id, publisher_id, genre_id, in_stock FROM books WHERE id = $1 FOR UPDATE;''',
+            book_data.id)
+        row = await connection.fetchrow(query, book_data.id, book_data.name, book_data.author_id,
+                                        book_data.publisher_id, book_data.genre_id, book_data.reserved_datetime,
+                                        book_data.reserved_user_id, book_data.in_stock, book_data.owner_id,
+                                        book_data.loaned_datetime, book_data.due_datetime)
+        deltas = {}
+        facet_deltas(deltas, old_row, -1)
+        facet_deltas(deltas, row, 1)
+        await apply_facet_deltas(deltas, session)
+        await notifications.notify(notifications.BOOKS_CHANNEL, connection)
+
+
+@repository_method
+async def reserve_book(book_id: int, user_id: int, now: int, session: Connection) -> bool:
+    """
+    Reserves the book in one conditional UPDATE, so of concurrent patrons only one succeeds
+    :param book_id:
+    :param user_id: reserving user
+    :param now: unix time
+    :param session: DB connection session
+    :return: True if the book was in stock without an active reservation and is now reserved
+    """
+    query = '''UPDATE books SET reserved_datetime = $3, reserver_id = $2,
+    change_seq = nextval('book_changes_seq'), change_xid = pg_current_xact_id()
+    WHERE id = $1 AND in_stock AND COALESCE(reserved_datetime, 0) <= $3 - $4 RETURNING id;'''
+    connection = session.raw_connection
+    async with session.transaction():
+        reserved = await connection.fetchval(query, book_id, user_id, now, settings.reservation_time)
+        if reserved is not None:
+            await notifications.notify(notifications.BOOKS_CHANNEL, connection)
+    return reserved is not None
+
+
+@repository_method
+async def unreserve_book(book_id: int, user_id: int, now: int, session: Connection) -> bool:
+    """
+    Cancels the user's active reservation in one conditional UPDATE
+    :param book_id:
+    :param user_id: user holding the reservation
+    :param now: unix time
+    :param session: DB connection session
+    :return: True if the user had an active reservation of the book
+    """
+    query = '''UPDATE books SET reserved_datetime = 0,
+    change_seq = nextval('book_changes_seq'), change_xid = pg_current_xact_id()
+    WHERE id = $1 AND reserver_id = $2 AND reserved_datetime > $3 - $4 RETURNING id;'''
+    connection = session.raw_connection
+    async with session.transaction():
+        unreserved = await connection.fetchval(query, book_id, user_id, now, settings.reservation_time)
+        if unreserved is not None:
+            await notifications.notify(notifications.BOOKS_CHANNEL, connection)
+    return unreserved is not None
 
 
+@repository_method
 async def delete_book(book_id: int, session: Connection):
-    query = f'''DELETE FROM books WHERE id = :id'''
-    await session.execute(query=query, values={'id': book_id})
+    query = f'''DELETE FROM books WHERE id = :id RETURNING author_id, publisher_id, genre_id, in_stock;'''
+    async with session.transaction():
+        row = await session.fetch_one(query=query, values={'id': book_id})
+        if row is not None:
+            query = '''INSERT INTO book_tombstones(book_id) VALUES(:id)
+            ON CONFLICT (book_id) DO UPDATE SET change_seq = nextval('book_changes_seq'),
+            change_xid = pg_current_xact_id();'''
+            await session.execute(query=query, values={'id': book_id})
+        deltas = {}
+        facet_deltas(deltas, row, -1)
+        await apply_facet_deltas(deltas, session)
+        await notifications.notify(notifications.BOOKS_CHANNEL, session)
@@ -0,0 +1,360 @@
+import inspect
+import itertools
+from bisect import bisect_left, bisect_right, insort
+from collections import defaultdict
+from functools import wraps
+from time import time
+from asyncpg.exceptions import UniqueViolationError
+from app import settings
+from app.db import notifications
+from app.schemas import books, miscs, users
+
+
+"""
+In-memory storage engine with the same semantics as the Postgres crud functions:
+unique names and logins, secondary indexes and facet counters. Every method runs without awaiting
+inside, so each write is atomic for the event loop. Used for tests and in-process benchmarks
+with STORAGE_BACKEND=memory
+"""
+BOOK_FIELDS = tuple(books.Book.__fields__)
+FILTER_COLUMNS = ('genre_id', 'author_id', 'publisher_id')
+FACET_COLUMNS = ('genre_id', 'author_id', 'publisher_id', 'in_stock')
+NAME_TABLES = {'genres': miscs.Genre, 'authors': miscs.Author, 'publishers': miscs.Publisher}
+
+
+def repository_method(func):
+    """
+    Routes crud function to the MemoryStorage method of the same name when session is a MemoryStorage,
+    otherwise runs the decorated Postgres implementation
+    """
+    assert hasattr(MemoryStorage, func.__name__), f'MemoryStorage.{func.__name__} is not implemented'
+    session_index = list(inspect.signature(func).parameters).index('session')
+
+    if inspect.isasyncgenfunction(func):
+        @wraps(func)
+        async def generator_wrapper(*args, **kwargs):
+            session = kwargs['session'] if 'session' in kwargs else args[session_index]
+            implementation = getattr(session, func.__name__) if isinstance(session, MemoryStorage) else func
+            async for item in implementation(*args, **kwargs):
+                yield item
+        return generator_wrapper
+
+    @wraps(func)
+    async def wrapper(*args, **kwargs):
+        session = kwargs['session'] if 'session' in kwargs else args[session_index]
+        if isinstance(session, MemoryStorage):
+            return await getattr(session, func.__name__)(*args, **kwargs)
+        return await func(*args, **kwargs)
+    return wrapper
+
+
+def project(row: dict, fields: tuple[str, ...] | None, model):
+    return model(**row) if fields is None else {field: row[field] for field in fields}
+
+
+def trigrams(text: str) -> set[str]:
+    text = f'  {text.lower()} '
+    return {text[i:i + 3] for i in range(len(text) - 2)}
+
+
+def similarity(left: str, right: str) -> float:
+    """pg_trgm similarity()"""
+    left, right = trigrams(left), trigrams(right)
+    return len(left & right) / len(left | right) if left | right else 0.0
+
+
+class MemoryStorage:
+    def __init__(self):
+        self.books: dict[int, dict] = {}
+        self.users: dict[int, dict] = {}
+        self.names: dict[str, dict[int, str]] = {table: {} for table in NAME_TABLES}
+        self.sequences = defaultdict(lambda: itertools.count(1))
+        self.book_names: dict[str, int] = {}
+        self.logins: dict[str, int] = {}
+        self.name_ids: dict[str, dict[str, int]] = {table: {} for table in NAME_TABLES}
+        self.sorted_names: dict[str, list[tuple[str, int, str]]] = {table: [] for table in NAME_TABLES}
+        self.book_indexes: dict[str, dict] = {column: defaultdict(set) for column in
+                                              FILTER_COLUMNS + ('owner_id', 'reserved_user_id')}
+        self.facets: dict[tuple[str, int], int] = defaultdict(int)
+        # change feed: book id -> latest change_seq, sorted change_seqs and change_seq -> (book id, deleted)
+        self.change_seq = itertools.count(1)
+        self.book_changes: dict[int, int] = {}
+        self.change_seqs: list[int] = []
+        self.changes: dict[int, tuple[int, bool]] = {}
+
+    # books
+
+    def index_book(self, row: dict, sign: int):
+        for column, index in self.book_indexes.items():
+            if row[column] is None:
+                continue
+            if sign > 0:
+                index[row[column]].add(row['id'])
+            else:
+                index[row[column]].discard(row['id'])
+        for column in FACET_COLUMNS:
+            if row[column] is not None:
+                self.facets[(column, int(row[column]))] += sign
+        if row['name'] is not None:
+            if sign > 0:
+                self.book_names[row['name']] = row['id']
+            else:
+                self.book_names.pop(row['name'], None)
+
+    def record_change(self, book_id: int, deleted: bool):
+        old_seq = self.book_changes.get(book_id)
+        if old_seq is not None:
+            del self.change_seqs[bisect_left(self.change_seqs, old_seq)]
+            del self.changes[old_seq]
+        seq = next(self.change_seq)
+        self.book_changes[book_id] = seq
+        self.change_seqs.append(seq)
+        self.changes[seq] = (book_id, deleted)
+
+    def books_changed(self):
+        notifications.dispatch(None, 0, notifications.BOOKS_CHANNEL, '')
+
+    async def get_book_by_id(self, book_id: int, session, fields: tuple[str, ...] = None):
+        row = self.books.get(book_id)
+        return project(row, fields, books.Book) if row else None
+
+    async def get_book_by_name(self, book_name: str, session):
+        book_id = self.book_names.get(book_name)
+        return books.Book(**self.books[book_id]) if book_id is not None else None
+
+    async def get_books_by_ids(self, book_ids: list[int], session, fields: tuple[str, ...] = None):
+        return [project(self.books[book_id], fields, books.Book) if book_id in self.books else None
+                for book_id in book_ids]
+
+    async def search_books(self, session, filter_name: str = None, filter_value: int = None,
+                           fields: tuple[str, ...] = None):
+        if filter_name and filter_value:
+            if filter_name not in FILTER_COLUMNS:
+                raise ValueError(f'Unsupported filter {filter_name}')
+            ids = sorted(self.book_indexes[filter_name].get(filter_value, ()))
+        else:
+            ids = sorted(self.books)
+        return [project(self.books[book_id], fields, books.Book) for book_id in ids]
+
+    async def get_books_by_owner(self, owner_id: int, session):
+        return [books.Book(**self.books[book_id])
+                for book_id in sorted(self.book_indexes['owner_id'].get(owner_id, ()))
+                if not self.books[book_id]['in_stock']]
+
+    async def get_books_by_reserver(self, reserver_id: int, session):
+        reserved_after = int(time()) - settings.reservation_time
+        return [books.Book(**self.books[book_id])
+                for book_id in sorted(self.book_indexes['reserved_user_id'].get(reserver_id, ()))
+                if self.books[book_id]['reserved_datetime'] > reserved_after]
+
+    async def iterate_overdue_loans(self, now: int, session):
+        overdue = sorted((row for row in self.books.values()
+                          if not row['in_stock'] and row['due_datetime'] is not None and row['due_datetime'] < now
+                          and row['owner_id'] in self.users), key=lambda row: (row['due_datetime'], row['id']))
+        for row in overdue:
+            user = self.users[row['owner_id']]
+            yield books.OverdueLoan(book_id=row['id'], book_name=row['name'], user_id=user['id'],
+                                    login=user['login'], email=user['email'],
+                                    loaned_datetime=row['loaned_datetime'], due_datetime=row['due_datetime'])
+
+    async def get_book_changes(self, since: tuple[int, int], limit: int, session):
+        # every write is committed at once, so its change_seq serves as the writer transaction id too
+        start = bisect_right(self.change_seqs, since[1])
+        changes = []
+        for seq in self.change_seqs[start:start + limit]:
+            book_id, deleted = self.changes[seq]
+            changes.append(books.BookChange(seq=seq, id=book_id, deleted=deleted,
+                                            book=None if deleted else books.Book(**self.books[book_id])))
+        next_cursor = books.BookChanges.make_cursor(changes[-1].seq, changes[-1].seq) if changes else \
+            books.BookChanges.make_cursor(*since)
+        return books.BookChanges(changes=changes, next_cursor=next_cursor,
+                                 has_more=len(self.change_seqs) > start + limit)
+
+    async def get_facets(self, session):
+        facets = books.Facets()
+        for (facet, value_id), count in sorted(self.facets.items(), key=lambda item: -item[1]):
+            if count <= 0:
+                continue
+            if facet == 'in_stock':
+                if value_id:
+                    facets.in_stock = count
+                else:
+                    facets.given_out = count
+                continue
+            table = facet.removesuffix('_id') + 's'
+            getattr(facets, table).append(books.FacetCount(id=value_id, name=self.names[table].get(value_id),
+                                                           count=count))
+        return facets
+
+    async def rebuild_facets(self, session):
+        self.facets.clear()
+        for row in self.books.values():
+            for column in FACET_COLUMNS:
+                if row[column] is not None:
+                    self.facets[(column, int(row[column]))] += 1
+
+    async def insert_book(self, book_data: books.NewBookData, session):
+        if book_data.name in self.book_names:
+            raise UniqueViolationError('duplicate key value violates unique constraint "books_name_key"')
+        row = {'id': next(self.sequences['books']), 'name': book_data.name, 'author_id': book_data.author_id,
+               'publisher_id': book_data.publisher_id, 'genre_id': book_data.genre_id, 'reserved_datetime': 0,
+               'reserved_user_id': None, 'in_stock': True, 'owner_id': None, 'loaned_datetime': None,
+               'due_datetime': None}
+        self.books[row['id']] = row
+        self.index_book(row, 1)
+        self.record_change(row['id'], False)
+        self.books_changed()
+
+    async def update_book(self, book_data: books.Book, session):
+        old_row = self.books.get(book_data.id)
+        if old_row is None:
+            return
+        row = {field: getattr(book_data, field) for field in BOOK_FIELDS}
+        if self.book_names.get(row['name'], row['id']) != row['id']:
+            raise UniqueViolationError('duplicate key value violates unique constraint "books_name_key"')
+        self.index_book(old_row, -1)
+        self.books[row['id']] = row
+        self.index_book(row, 1)
+        self.record_change(row['id'], False)
+        self.books_changed()
+
+    def set_reservation(self, row: dict, reserved_datetime: int, reserved_user_id: int | None):
+        self.index_book(row, -1)
+        row['reserved_datetime'] = reserved_datetime
+        row['reserved_user_id'] = reserved_user_id
+        self.index_book(row, 1)
+        self.record_change(row['id'], False)
+        self.books_changed()
+
+    async def reserve_book(self, book_id: int, user_id: int, now: int, session):
+        row = self.books.get(book_id)
+        if row is None or not row['in_stock'] or (row['reserved_datetime'] or 0) > now - settings.reservation_time:
+            return False
+        self.set_reservation(row, now, user_id)
+        return True
+
+    async def unreserve_book(self, book_id: int, user_id: int, now: int, session):
+        row = self.books.get(book_id)
+        if row is None or row['reserved_user_id'] != user_id or \
+                (row['reserved_datetime'] or 0) <= now - settings.reservation_time:
+            return False
+        self.set_reservation(row, 0, user_id)
+        return True
+
+    async def delete_book(self, book_id: int, session):
+        row = self.books.pop(book_id, None)
+        if row is None:
+            return
+        self.index_book(row, -1)
+        self.record_change(book_id, True)
+        self.books_changed()
+
+    # users
+
+    async def get_user_by_id(self, user_id: int, session):
+        row = self.users.get(user_id)
+        return users.User(**row) if row else None
+
+    async def get_no_password_user_by_id(self, user_id: int, session, fields: tuple[str, ...] = None):
+        row = self.users.get(user_id)
+        return project(row, fields, users.NoPasswordUser) if row else None
+
+    async def get_no_password_users_by_ids(self, user_ids: list[int], session):
+        return [users.NoPasswordUser(**self.users[user_id]) if user_id in self.users else None
+                for user_id in user_ids]
+
+    async def get_user_by_login(self, login: str, session):
+        user_id = self.logins.get(login)
+        return users.User(**self.users[user_id]) if user_id is not None else None
+
+    async def get_users(self, session, fields: tuple[str, ...] = None):
+        return [project(self.users[user_id], fields, users.NoPasswordUser) for user_id in sorted(self.users)]
+
+    async def insert_user(self, user_data: users.NewUserData, session):
+        if user_data.login in self.logins:
+            raise UniqueViolationError('duplicate key value violates unique constraint "users_login_key"')
+        row = {'id': next(self.sequences['users']), 'email': user_data.email, 'login': user_data.login,
+               'password_hash': user_data.password, 'role': user_data.role, 'active': True}
+        self.users[row['id']] = row
+        self.logins[row['login']] = row['id']
+
+    async def get_existing_logins(self, logins: list[str], session):
+        return {login for login in logins if login in self.logins}
+
+    async def insert_users(self, users_data: list[users.NewUserData], session):
+        inserted = set()
+        for user_data in users_data:
+            if user_data.login in self.logins:
+                continue
+            await self.insert_user(user_data, session)
+            inserted.add(user_data.login)
+        return inserted
+
+    async def update_user(self, user_data: users.User, session):
+        old_row = self.users.get(user_data.id)
+        if old_row is None:
+            return
+        if self.logins.get(user_data.login, user_data.id) != user_data.id:
+            raise UniqueViolationError('duplicate key value violates unique constraint "users_login_key"')
+        self.logins.pop(old_row['login'], None)
+        self.users[user_data.id] = user_data.dict()
+        self.logins[user_data.login] = user_data.id
+
+    async def delete_user(self, user_id: int, session):
+        row = self.users.pop(user_id, None)
+        if row is not None:
+            self.logins.pop(row['login'], None)
+
+    # genres, authors, publishers
+
+    def get_name(self, table: str, item_id: int):
+        name = self.names[table].get(item_id)
+        return NAME_TABLES[table](id=item_id, name=name) if name is not None else None
+
+    def get_or_insert_name(self, table: str, name: str):
+        item_id = self.name_ids[table].get(name)
+        if item_id is None:
+            item_id = next(self.sequences[table])
+            self.names[table][item_id] = name
+            self.name_ids[table][name] = item_id
+            insort(self.sorted_names[table], (name.lower(), item_id, name))
+            notifications.dispatch(None, 0, notifications.NAMES_CHANNEL, table)
+        return NAME_TABLES[table](id=item_id, name=name)
+
+    async def get_genre_by_id(self, genre_id: int, session):
+        return self.get_name('genres', genre_id)
+
+    async def get_or_insert_genre(self, genre_name: str, session):
+        return self.get_or_insert_name('genres', genre_name)
+
+    async def get_author_by_id(self, author_id: int, session):
+        return self.get_name('authors', author_id)
+
+    async def get_or_insert_author(self, author_name: str, session):
+        return self.get_or_insert_name('authors', author_name)
+
+    async def get_publisher_by_id(self, publisher_id: int, session):
+        return self.get_name('publishers', publisher_id)
+
+    async def get_or_insert_publisher(self, publisher_name: str, session):
+        return self.get_or_insert_name('publishers', publisher_name)
+
+    async def suggest_by_prefix(self, table: str, prefix: str, limit: int, session):
+        prefix = prefix.lower()
+        index = self.sorted_names[table]
+        suggestions = []
+        for position in range(bisect_left(index, (prefix,)), len(index)):
+            name_lower, item_id, name = index[position]
+            if len(suggestions) >= limit or not name_lower.startswith(prefix):
+                break
+            suggestions.append(miscs.Suggestion(id=item_id, name=name))
+        return suggestions
+
+    async def suggest_similar(self, table: str, text: str, limit: int, session):
+        # pg_trgm default similarity threshold for the % operator
+        scored = [(similarity(name, text), name, item_id) for item_id, name in self.names[table].items()]
+        scored = sorted((item for item in scored if item[0] >= 0.3), key=lambda item: (-item[0], item[1]))
+        return [miscs.Suggestion(id=item_id, name=name) for _, name, item_id in scored[:limit]]
+
+
+storage = MemoryStorage()
@@ -1,18 +1,41 @@
 from typing import AsyncGenerator, Any
 from databases.core import Connection, Database
-from app.settings import postgre_url
+from app.settings import postgre_url, DB_POOL_MIN_SIZE, DB_POOL_MAX_SIZE, STORAGE_BACKEND
 import databases.backends.postgres
 from passlib.hash import bcrypt
 from app.schemas import miscs, users
 from app.crud.user import get_user_by_login
+from app.crud.singleflight import single_flight
+from app.db import notifications, replicas
+from app.crud import memory
+from app.crud.memory import repository_method
 
 
 databases.backends.postgres.Record.__iter__ = lambda self: iter(self._row)
 
+database = Database(postgre_url, min_size=DB_POOL_MIN_SIZE, max_size=DB_POOL_MAX_SIZE)
+
 
 async def get_session() -> AsyncGenerator[Connection, Any]:
-    """Return DB session"""
-    async with Database(postgre_url) as db, db.connection() as conn:
+    """Return DB session from the worker's connection pool"""
+    if STORAGE_BACKEND == 'memory':
+        yield memory.storage
+        return
+    if not database.is_connected:
+        await database.connect()
+    async with database.connection() as conn:
+        yield conn
+
+
+async def get_read_session() -> AsyncGenerator[Connection, Any]:
+    """Return DB session from a healthy replica for read-only routes, primary if there is none"""
+    replica = replicas.choose()
+    if replica is None:
+        async for conn in get_session():
+            yield conn
+        return
+    async with replica.database.connection() as conn:
+        conn.read_only = True
         yield conn
 
 
@@ -32,46 +55,58 @@ async def authorize(authorization: miscs.Authorization,
     return user if check else None
 
 
+@single_flight('genre_id')
+@repository_method
 async def get_genre_by_id(genre_id: int, session: Connection) -> miscs.Genre:
     query = '''SELECT * FROM genres WHERE id = :id;'''
     result = await session.fetch_one(query=query, values={'id': genre_id})
     return miscs.Genre.from_orm(result) if result else None
 
 
+@repository_method
 async def get_or_insert_genre(genre_name: str, session: Connection) -> miscs.Genre:
     query = '''SELECT * FROM genres WHERE name = :name;'''
     result = await session.fetch_one(query, values={'name': genre_name})
     if not result:
         query = '''INSERT INTO genres (name) VALUES (:name) RETURNING *;'''
         result = await session.fetch_one(query=query, values={'name': genre_name})
+        await notifications.notify(notifications.NAMES_CHANNEL, session, 'genres')
     return miscs.Genre.from_orm(result)
 
 
+@single_flight('author_id')
+@repository_method
 async def get_author_by_id(author_id: int, session: Connection) -> miscs.Author:
     query = '''SELECT * FROM authors WHERE id = :id;'''
     result = await session.fetch_one(query=query, values={'id': author_id})
     return miscs.Author.from_orm(result) if result else None
 
 
+@repository_method
 async def get_or_insert_author(author_name: str, session: Connection) -> miscs.Author:
     query = '''SELECT * FROM authors WHERE name = :name;'''
     result = await session.fetch_one(query, values={'name': author_name})
     if not result:
         query = '''INSERT INTO authors (name) VALUES (:name) RETURNING *;'''
         result = await session.fetch_one(query=query, values={'name': author_name})
+        await notifications.notify(notifications.NAMES_CHANNEL, session, 'authors')
     return miscs.Author.from_orm(result)
 
 
+@single_flight('publisher_id')
+@repository_method
 async def get_publisher_by_id(publisher_id: int, session: Connection) -> miscs.Publisher:
     query = '''SELECT * FROM publishers WHERE id = :id;'''
     result = await session.fetch_one(query=query, values={'id': publisher_id})
     return miscs.Publisher.from_orm(result) if result else None
 
 
+@repository_method
 async def get_or_insert_publisher(publisher_name: str, session: Connection) -> miscs.Publisher:
     query = '''SELECT * FROM publishers WHERE name = :name;'''
     result = await session.fetch_one(query, values={'name': publisher_name})
     if not result:
         query = '''INSERT INTO publishers (name) VALUES (:name) RETURNING *;'''
         result = await session.fetch_one(query=query, values={'name': publisher_name})
+        await notifications.notify(notifications.NAMES_CHANNEL, session, 'publishers')
     return miscs.Publisher.from_orm(result)
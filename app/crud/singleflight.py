@@ -0,0 +1,80 @@
+import asyncio
+import copy
+import inspect
+from functools import wraps
+from typing import Any, Awaitable, Callable, Hashable
+from app.settings import SINGLE_FLIGHT_ENABLED
+
+
+class SingleFlightGroup:
+    """
+    Collapses concurrent identical calls into one: the first caller starts the query,
+    callers arriving while it is in flight wait for the same result.
+    The query runs on the first caller's connection, so it is cancelled together with that caller
+    and the waiting callers retry on their own connections
+    """
+
+    def __init__(self, name: str):
+        self.name = name
+        self.in_flight: dict[Hashable, asyncio.Task] = {}
+        self.calls = 0
+        self.collapsed = 0
+
+    async def do(self, key: Hashable, func: Callable[[], Awaitable[Any]]) -> Any:
+        # the task result stays pristine: every caller, the leader included, gets its own copy,
+        # endpoints modify returned models before other callers resume
+        while True:
+            task = self.in_flight.get(key)
+            if task is None or task.cancelled():
+                self.calls += 1
+                task = asyncio.ensure_future(func())
+                self.in_flight[key] = task
+                task.add_done_callback(lambda done: self.forget(key, done))
+                # not shielded: a cancelled leader returns its connection to the pool,
+                # the query must not outlive it there
+                return copy.deepcopy(await task)
+            self.collapsed += 1
+            try:
+                return copy.deepcopy(await asyncio.shield(task))
+            except asyncio.CancelledError:
+                if not task.cancelled() or asyncio.current_task().cancelling():
+                    raise
+
+    def forget(self, key: Hashable, task: asyncio.Task):
+        if self.in_flight.get(key) is task:
+            del self.in_flight[key]
+
+    def stats(self) -> dict:
+        return {'calls': self.calls, 'collapsed': self.collapsed, 'in_flight': len(self.in_flight)}
+
+
+groups: dict[str, SingleFlightGroup] = {}
+
+
+def single_flight(*key_args: str):
+    """
+    Decorator for read-only crud helpers
+    :param key_args: names of the arguments identifying the call, session must not be among them
+    """
+    def decorator(func):
+        signature = inspect.signature(func)
+        group = groups.setdefault(func.__qualname__, SingleFlightGroup(func.__qualname__))
+
+        @wraps(func)
+        async def wrapper(*args, **kwargs):
+            if not SINGLE_FLIGHT_ENABLED:
+                return await func(*args, **kwargs)
+            bound = signature.bind(*args, **kwargs)
+            bound.apply_defaults()
+            # replica reads must not be shared with callers expecting primary data
+            key = (getattr(bound.arguments.get('session'), 'read_only', False),
+                   *(bound.arguments[name] for name in key_args))
+            return await group.do(key, lambda: func(*args, **kwargs))
+
+        wrapper.single_flight_group = group
+        return wrapper
+    return decorator
+
+
+def get_stats() -> dict[str, dict]:
+    return {name: group.stats() for name, group in groups.items()}
@@ -1,36 +1,66 @@
 from databases.core import Connection
 import databases.backends.postgres
 from app.schemas import users
+from app.settings import BULK_INSERT_BATCH
+from app.crud.singleflight import single_flight
+from app.crud.memory import repository_method
 
 
 databases.backends.postgres.Record.__iter__ = lambda self: iter(self._row)
 
 
+NO_PASSWORD_COLUMNS = ('id', 'email', 'login', 'role', 'active')
+
+
+def to_no_password_user(item, fields: tuple[str, ...] = None) -> users.NoPasswordUser | dict:
+    """schemas.NoPasswordUser for full rows, plain dict of requested fields otherwise"""
+    return users.NoPasswordUser.from_orm(item) if fields is None else dict(item._mapping.items())
+
+
+@single_flight('user_id')
+@repository_method
 async def get_user_by_id(user_id: int, session: Connection) -> users.User:
     query = '''SELECT * FROM users WHERE id = :id'''
     result = await session.fetch_one(query=query, values={'id': user_id})
     return users.User.from_orm(result) if result else None
 
 
-async def get_no_password_user_by_id(user_id: int, session: Connection) -> users.NoPasswordUser:
-    query = '''SELECT id, email, login, role, active FROM users;'''
+@repository_method
+async def get_no_password_user_by_id(user_id: int, session: Connection,
+                                     fields: tuple[str, ...] = None) -> users.NoPasswordUser | dict:
+    query = f'''SELECT {', '.join(fields or NO_PASSWORD_COLUMNS)} FROM users WHERE id = :id;'''
     result = await session.fetch_one(query=query, values={'id': user_id})
-    return users.NoPasswordUser.from_orm(result) if result else None
+    return to_no_password_user(result, fields) if result else None
 
 
+@repository_method
+async def get_no_password_users_by_ids(user_ids: list[int],
+                                       session: Connection) -> list[users.NoPasswordUser | None]:
+    """Returns users in the order of given ids, None for ids that don't exist"""
+    query = '''SELECT id, email, login, role, active FROM users WHERE id = ANY(:ids);'''
+    result = await session.fetch_all(query=query, values={'ids': list(set(user_ids))})
+    found = {item.id: users.NoPasswordUser.from_orm(item) for item in result}
+    return [found.get(user_id) for user_id in user_ids]
+
+
+@single_flight('login')
+@repository_method
 async def get_user_by_login(login: str, session: Connection) -> users.User:
-    query = '''SELECT * FROM users WHERE login = :login;'''
-    result = await session.fetch_one(query=query, values={'login': login})
-    return users.User.from_orm(result) if result else None
+    # hot path for every authorized request: native asyncpg call with cached prepared statement
+    query = '''SELECT id, email, login, password_hash, role, active FROM users WHERE login = $1;'''
+    result = await session.raw_connection.fetchrow(query, login)
+    return users.User(**result) if result else None
 
 
-async def get_users(session: Connection) -> list[users.NoPasswordUser]:
-    query = '''SELECT id, email, login, role, active FROM users;'''
+@repository_method
+async def get_users(session: Connection, fields: tuple[str, ...] = None) -> list[users.NoPasswordUser | dict]:
+    query = f'''SELECT {', '.join(fields or NO_PASSWORD_COLUMNS)} FROM users;'''
     result = await session.fetch_all(query=query)
-    all_users = [users.NoPasswordUser.from_orm(user_data) for user_data in result]
+    all_users = [to_no_password_user(user_data, fields) for user_data in result]
     return all_users
 
 
+@repository_method
 async def insert_user(user_data: users.NewUserData, session: Connection):
     query = '''INSERT INTO users(email, login, password_hash, role) VALUES 
     (:email, :login, :password, :role);'''
@@ -38,6 +68,37 @@ async def insert_user(user_data: users.NewUserData, session: Connection):
     await session.execute(query=query, values=values)
 
 
+@repository_method
+async def get_existing_logins(logins: list[str], session: Connection) -> set[str]:
+    query = '''SELECT login FROM users WHERE login = ANY($1::varchar[]);'''
+    result = await session.raw_connection.fetch(query, logins)
+    return {item['login'] for item in result}
+
+
+@repository_method
+async def insert_users(users_data: list[users.NewUserData], session: Connection) -> set[str]:
+    """
+    Inserts users with hashed passwords in BULK_INSERT_BATCH rows statements inside one transaction,
+    rows with logins that already exist are skipped
+    :param users_data: users with password_hash in password field
+    :param session: DB connection session
+    :return: logins of inserted users
+    """
+    query = '''INSERT INTO users(email, login, password_hash, role)
+    SELECT * FROM unnest($1::varchar[], $2::varchar[], $3::varchar[], $4::varchar[])
+    ON CONFLICT (login) DO NOTHING RETURNING login;'''
+    inserted = set()
+    async with session.transaction():
+        connection = session.raw_connection
+        for start in range(0, len(users_data), BULK_INSERT_BATCH):
+            batch = users_data[start:start + BULK_INSERT_BATCH]
+            result = await connection.fetch(query, [user.email for user in batch], [user.login for user in batch],
+                                             [user.password for user in batch], [user.role for user in batch])
+            inserted.update(item['login'] for item in result)
+    return inserted
+
+
+@repository_method
 async def update_user(user_data: users.User, session: Connection):
     query = '''UPDATE users SET email = :email, login = :login, password_hash = :password_hash,
     active = :active, role = :role WHERE id = :id;'''
@@ -45,6 +106,7 @@ async def update_user(user_data: users.User, session: Connection):
     await session.execute(query=query, values=values)
 
 
+@repository_method
 async def delete_user(user_id: int, session: Connection):
     query = '''DELETE FROM users WHERE id = :id'''
     await session.execute(query, {'id': user_id})
@@ -1,10 +1,12 @@
-from sqlalchemy import create_engine, Column, Integer, String, Sequence, Boolean
+from sqlalchemy import create_engine, Column, Integer, BigInteger, String, Sequence, Boolean, Index, DDL, event, func, text
 from sqlalchemy.orm import declarative_base
+from sqlalchemy.types import UserDefinedType
 from app.settings import postgre_url
 
 
 engine = create_engine(postgre_url)
 Base = declarative_base()
+event.listen(Base.metadata, 'before_create', DDL('CREATE EXTENSION IF NOT EXISTS pg_trgm'))
 
 
 class User(Base):
@@ -17,6 +19,18 @@ class User(Base):
     active = Column(Boolean, default=True)
 
 
+class Xid8(UserDefinedType):
+    cache_ok = True
+
+    def get_col_spec(self, **kw):
+        return 'xid8'
+
+
+# change feed: every insert, update and delete of a book takes the next value
+# and the id of the writing transaction, feed is ordered by (change_xid, change_seq)
+book_changes_seq = Sequence('book_changes_seq', metadata=Base.metadata)
+
+
 class Book(Base):
     __tablename__ = 'books'
     id = Column(Integer, Sequence("books_id_seq", start=1), primary_key=True)
@@ -25,24 +39,59 @@ class Book(Base):
     publisher_id = Column(Integer)
     genre_id = Column(Integer)
     reserved_datatime = Column(Integer, default=0)
-    reserver_id = Column(Integer, nullable=True)
+    reserver_id = Column(Integer, nullable=True, index=True)
     in_stock = Column(Boolean, default=True)
-    owner_id = Column(Integer, nullable=True, default=None)
+    owner_id = Column(Integer, nullable=True, default=None, index=True)
+    loaned_datetime = Column(Integer, nullable=True)
+    due_datetime = Column(Integer, nullable=True)
+    change_seq = Column(BigInteger, server_default=book_changes_seq.next_value(), nullable=False)
+    change_xid = Column(Xid8, server_default=func.pg_current_xact_id(), nullable=False)
+
+    __table_args__ = (
+        # overdue report: only outstanding loans are indexed
+        Index('ix_books_due_outstanding', due_datetime, postgresql_where=text('in_stock = false')),
+        Index('ix_books_change_xid_seq', change_xid, change_seq),
+    )
+
+
+class BookTombstone(Base):
+    __tablename__ = 'book_tombstones'
+    book_id = Column(Integer, primary_key=True, autoincrement=False)
+    change_seq = Column(BigInteger, server_default=book_changes_seq.next_value(), nullable=False)
+    change_xid = Column(Xid8, server_default=func.pg_current_xact_id(), nullable=False)
+
+    __table_args__ = (Index('ix_book_tombstones_change_xid_seq', change_xid, change_seq),)
 
 
 class Genre(Base):
     __tablename__ = 'genres'
     id = Column(Integer, Sequence("genres_id_seq", start=1), primary_key=True)
-    name = Column(String(50))
+    name = Column(String(50), unique=True)
 
 
 class Author(Base):
     __tablename__ = 'authors'
     id = Column(Integer, Sequence("authors_id_seq", start=1), primary_key=True)
-    name = Column(String(100))
+    name = Column(String(100), unique=True)
 
 
 class Publisher(Base):
     __tablename__ = 'publishers'
     id = Column(Integer, Sequence("publishers_id_seq", start=1), primary_key=True)
-    name = Column(String(100))
+    name = Column(String(100), unique=True)
+
+
+class BookFacet(Base):
+    __tablename__ = 'book_facets'
+    facet = Column(String(20), primary_key=True)
+    value_id = Column(Integer, primary_key=True)
+    count = Column(Integer, nullable=False, default=0)
+
+
+for model in (Genre, Author, Publisher):
+    # prefix autocomplete: lower(name) LIKE 'abc%'
+    Index(f'ix_{model.__tablename__}_name_prefix', func.lower(model.name).label('name_lower'),
+          postgresql_ops={'name_lower': 'text_pattern_ops'})
+    # fuzzy autocomplete: name % 'abc'
+    Index(f'ix_{model.__tablename__}_name_trgm', model.name,
+          postgresql_using='gin', postgresql_ops={'name': 'gin_trgm_ops'})
@@ -0,0 +1,132 @@
+import asyncio
+import logging
+from collections import defaultdict
+from typing import Callable
+import asyncpg
+from databases.core import Connection
+from app import settings
+from app.settings import postgre_url
+
+
+"""Cross-worker invalidation channel for in-process caches built on Postgres LISTEN/NOTIFY"""
+logger = logging.getLogger(__name__)
+BOOKS_CHANNEL = 'books_changed'
+NAMES_CHANNEL = 'catalogue_names_changed'
+subscribers: dict[str, list[Callable[[str], None]]] = defaultdict(list)
+listener_connection: asyncpg.Connection | None = None
+listener_lost = asyncio.Event()
+
+
+def subscribe(channel: str, callback: Callable[[str], None]):
+    """
+    Registers callback called with notification payload in every worker.
+    After the listener reconnects it is called with an empty payload: notifications sent
+    while it was down are lost, so anything may have changed.
+    Must be called at import time, before start_listener()
+    :param channel: channel name
+    :param callback: function accepting payload string
+    """
+    subscribers[channel].append(callback)
+
+
+async def notify(channel: str, session: Connection | asyncpg.Connection, payload: str = ''):
+    """
+    Sends notification to all workers, including the current one.
+    Inside a transaction it is delivered only after commit
+    :param channel: channel name
+    :param session: DB connection session, or its raw_connection on native asyncpg paths
+    :param payload: short message passed to callbacks
+    """
+    if not isinstance(session, Connection):
+        await session.execute('''SELECT pg_notify($1, $2);''', channel, payload)
+        return
+    query = '''SELECT pg_notify(:channel, :payload);'''
+    await session.execute(query=query, values={'channel': channel, 'payload': payload})
+
+
+def dispatch(connection: asyncpg.Connection, pid: int, channel: str, payload: str):
+    for callback in subscribers[channel]:
+        callback(payload)
+
+
+def on_listener_terminated(connection: asyncpg.Connection):
+    listener_lost.set()
+
+
+async def connect_listener():
+    global listener_connection
+    listener_lost.clear()
+    listener_connection = await asyncpg.connect(postgre_url)
+    listener_connection.add_termination_listener(on_listener_terminated)
+    for channel in subscribers:
+        await listener_connection.add_listener(channel, dispatch)
+
+
+def drop_listener():
+    global listener_connection
+    if listener_connection is None:
+        return
+    listener_connection.remove_termination_listener(on_listener_terminated)
+    if not listener_connection.is_closed():
+        listener_connection.terminate()
+    listener_connection = None
+
+
+async def is_listener_alive() -> bool:
+    # a half-open TCP connection is never reported as terminated, only a query finds it
+    if listener_connection is None or listener_connection.is_closed():
+        return False
+    try:
+        await asyncio.wait_for(listener_connection.fetchval('''SELECT 1;'''), settings.LISTENER_HEALTH_INTERVAL)
+    except Exception:
+        return False
+    return True
+
+
+async def reconnect_listener():
+    delay = 1.0
+    while True:
+        drop_listener()
+        try:
+            await connect_listener()
+        except Exception as error:
+            logger.warning('LISTEN connection failed, retrying in %.0f s: %r', delay, error)
+            await asyncio.sleep(delay)
+            delay = min(delay * 2, settings.LISTENER_RECONNECT_MAX_DELAY)
+            continue
+        logger.info('LISTEN connection re-established')
+        for channel, callbacks in subscribers.items():
+            for callback in callbacks:
+                callback('')
+        return
+
+
+async def start_listener():
+    if listener_connection is not None or not subscribers:
+        return
+    await connect_listener()
+
+
+async def run_listener():
+    """
+    Watches the LISTEN connection, re-established with backoff when it is terminated
+    or stops answering health checks (DB restart, failover, idle timeout)
+    """
+    if not subscribers:
+        return
+    while True:
+        try:
+            await asyncio.wait_for(listener_lost.wait(), settings.LISTENER_HEALTH_INTERVAL)
+        except asyncio.TimeoutError:
+            if await is_listener_alive():
+                continue
+        await reconnect_listener()
+
+
+async def stop_listener():
+    global listener_connection
+    if listener_connection is None:
+        return
+    listener_connection.remove_termination_listener(on_listener_terminated)
+    await listener_connection.close()
+    listener_connection = None
@@ -0,0 +1,77 @@
+import asyncio
+import itertools
+import logging
+import time
+from dataclasses import dataclass
+from databases.core import Database
+from app import settings
+
+
+"""Read replicas with round-robin selection and periodic health and lag checks"""
+logger = logging.getLogger(__name__)
+
+
+@dataclass
+class Replica:
+    name: str
+    database: Database
+    healthy: bool = False
+    lag: float | None = None
+    checked_at: float | None = None
+    error: str | None = None
+
+    def stats(self) -> dict:
+        return {'healthy': self.healthy, 'lag': self.lag, 'checked_at': self.checked_at, 'error': self.error}
+
+
+replicas = [Replica(url.rsplit('@', 1)[-1],
+                    Database(url, min_size=settings.DB_POOL_MIN_SIZE, max_size=settings.DB_POOL_MAX_SIZE))
+            for url in settings.replica_urls]
+round_robin = itertools.count()
+
+
+def choose() -> Replica | None:
+    """Next healthy replica, None if there are none and reads must go to the primary"""
+    healthy = [replica for replica in replicas if replica.healthy]
+    if not healthy:
+        return
+    return healthy[next(round_robin) % len(healthy)]
+
+
+async def check(replica: Replica):
+    # replay timestamp gets old on an idle primary, so a fully replayed replica counts as zero lag,
+    # but only while its WAL receiver is streaming: a disconnected one replays all it got and stays behind
+    query = '''SELECT CASE WHEN NOT pg_is_in_recovery() THEN 0
+    WHEN NOT EXISTS (SELECT 1 FROM pg_stat_wal_receiver WHERE status = 'streaming') THEN NULL
+    WHEN pg_last_wal_receive_lsn() = pg_last_wal_replay_lsn() THEN 0
+    ELSE COALESCE(EXTRACT(EPOCH FROM now() - pg_last_xact_replay_timestamp()), 0) END AS lag;'''
+    try:
+        if not replica.database.is_connected:
+            await replica.database.connect()
+        lag = await asyncio.wait_for(replica.database.fetch_val(query), settings.REPLICA_HEALTH_INTERVAL)
+        replica.lag = float(lag) if lag is not None else None
+        replica.healthy = replica.lag is not None and replica.lag <= settings.REPLICA_MAX_LAG
+        if replica.lag is None:
+            replica.error = 'WAL receiver is not streaming'
+        else:
+            replica.error = None if replica.healthy else 'Replication lag is too big'
+    except Exception as error:
+        replica.healthy = False
+        replica.error = repr(error)
+    replica.checked_at = time.time()
+
+
+async def run_health_checks():
+    while True:
+        await asyncio.gather(*(check(replica) for replica in replicas))
+        await asyncio.sleep(settings.REPLICA_HEALTH_INTERVAL)
+
+
+async def disconnect():
+    for replica in replicas:
+        if replica.database.is_connected:
+            await replica.database.disconnect()
+
+
+def get_stats() -> dict[str, dict]:
+    return {replica.name: replica.stats() for replica in replicas}
@@ -2,6 +2,7 @@ from databases.core import Connection
 
 
 async def create_tables(session: Connection):
+    await session.execute('''CREATE EXTENSION IF NOT EXISTS pg_trgm;''')
     query = '''CREATE TABLE IF NOT EXISTS users(
             id SERIAL PRIMARY KEY ,
             email VARCHAR(50),
@@ -10,6 +11,7 @@ async def create_tables(session: Connection):
             role VARCHAR(50),
             active BOOLEAN DEFAULT TRUE);'''
     await session.execute(query)
+    await session.execute('''CREATE SEQUENCE IF NOT EXISTS book_changes_seq;''')
     query = '''CREATE TABLE IF NOT EXISTS books(
             id SERIAL PRIMARY KEY,
             name VARCHAR(100) UNIQUE,
@@ -19,7 +21,26 @@ async def create_tables(session: Connection):
             reserved_datetime INTEGER DEFAULT 0,
             reserver_id INTEGER DEFAULT NULL,
             in_stock BOOLEAN DEFAULT TRUE, 
-            owner_id INTEGER DEFAULT NULL);'''
+            owner_id INTEGER DEFAULT NULL,
+            loaned_datetime INTEGER DEFAULT NULL,
+            due_datetime INTEGER DEFAULT NULL,
+            change_seq BIGINT NOT NULL DEFAULT nextval('book_changes_seq'),
+            change_xid XID8 NOT NULL DEFAULT pg_current_xact_id());'''
+    await session.execute(query)
+    query = '''CREATE INDEX IF NOT EXISTS ix_books_change_xid_seq ON books (change_xid, change_seq);'''
+    await session.execute(query)
+    query = '''CREATE TABLE IF NOT EXISTS book_tombstones(
+            book_id INTEGER PRIMARY KEY,
+            change_seq BIGINT NOT NULL DEFAULT nextval('book_changes_seq'),
+            change_xid XID8 NOT NULL DEFAULT pg_current_xact_id());'''
+    await session.execute(query)
+    query = '''CREATE INDEX IF NOT EXISTS ix_book_tombstones_change_xid_seq ON book_tombstones (change_xid, change_seq);'''
+    await session.execute(query)
+    query = '''CREATE INDEX IF NOT EXISTS ix_books_owner_id ON books (owner_id);'''
+    await session.execute(query)
+    query = '''CREATE INDEX IF NOT EXISTS ix_books_reserver_id ON books (reserver_id);'''
+    await session.execute(query)
+    query = '''CREATE INDEX IF NOT EXISTS ix_books_due_outstanding ON books (due_datetime) WHERE in_stock = FALSE;'''
     await session.execute(query)
     query = '''CREATE TABLE IF NOT EXISTS genres(
             id SERIAL PRIMARY KEY,
@@ -33,3 +54,14 @@ async def create_tables(session: Connection):
                 id SERIAL PRIMARY KEY,
                 name VARCHAR(100) UNIQUE);'''
     await session.execute(query)
+    for table in ('genres', 'authors', 'publishers'):
+        query = f'''CREATE INDEX IF NOT EXISTS ix_{table}_name_prefix ON {table} (lower(name) text_pattern_ops);'''
+        await session.execute(query)
+        query = f'''CREATE INDEX IF NOT EXISTS ix_{table}_name_trgm ON {table} USING gin (name gin_trgm_ops);'''
+        await session.execute(query)
+    query = '''CREATE TABLE IF NOT EXISTS book_facets(
+                facet VARCHAR(20),
+                value_id INTEGER,
+                count INTEGER NOT NULL DEFAULT 0,
+                PRIMARY KEY (facet, value_id));'''
+    await session.execute(query)
@@ -1,26 +1,30 @@
 from databases.core import Connection
-from fastapi import APIRouter, Depends, HTTPException, BackgroundTasks
-from app import utils
+from fastapi import APIRouter, Depends, HTTPException, BackgroundTasks, Query, UploadFile
+from app import utils, settings, admission, compression
 from app.crud import user as db_user
 from app.crud import misc as db_misc
+from app.crud import singleflight
+from app.db import replicas
 from app.schemas import users, miscs
 
 router = APIRouter(prefix="/api/v1/admin")
 
 
-@router.get('users', response_model=list[users.NoPasswordUser])
-async def get_users(authorized_user: users.User = Depends(utils.get_current_user),
-                    session: Connection = Depends(db_misc.get_session)):
+@router.get('/users', response_model=list[users.NoPasswordUser])
+async def get_users(fields: str = None, authorized_user: users.User = Depends(utils.get_current_user),
+                    session: Connection = Depends(db_misc.get_read_session)):
     """
     Get information about all users
+    :param fields: comma separated schemas.NoPasswordUser fields to return, all by default
     :param authorized_user: schemas.User
     :param session: Connection object
     :return: users list[schemas.NoPasswordUser]
     """
     if not (authorized_user and authorized_user.check_role('admin')):
         return HTTPException(status_code=401)
-    all_users = await db_user.get_users(session)
-    return all_users
+    fields = utils.parse_fields(fields, users.NoPasswordUser)
+    all_users = await db_user.get_users(session, fields=fields)
+    return utils.fields_response(all_users, fields)
 
 
 @router.post('/users', response_model=miscs.GenericResponse)
@@ -43,6 +47,50 @@ async def create_user(new_user: users.NewUserData, background_tasks: BackgroundT
     return miscs.GenericResponse(result=True)
 
 
+@router.post('/users/bulk', response_model=users.BulkUsersReport)
+async def create_users_bulk(file: UploadFile, background_tasks: BackgroundTasks,
+                            authorized_user: users.User = Depends(utils.get_current_user),
+                            session: Connection = Depends(db_misc.get_session)):
+    """
+    Creates users from CSV (email,login,password,role header) or JSON array file in one transaction.
+    Rows with invalid data or taken logins are skipped and reported
+    :param file: uploaded users file
+    :param background_tasks: Background tasks
+    :param authorized_user: schemas.User object
+    :param session: Connection object
+    :return: schemas.BulkUsersReport
+    """
+    if not (authorized_user and authorized_user.check_role('admin')):
+        raise HTTPException(status_code=401)
+    rows = utils.parse_bulk_users(await file.read(), file.filename, file.content_type)
+    report = {}
+    candidates = []
+    seen_logins = set()
+    for row, user in rows:
+        if isinstance(user, str):
+            report[row] = users.BulkUserRow(row=row, created=False, error=user)
+        elif user.login in seen_logins:
+            report[row] = users.BulkUserRow(row=row, login=user.login, created=False, error='Duplicate login in file')
+        else:
+            seen_logins.add(user.login)
+            candidates.append((row, user))
+    # taken logins are skipped before hashing, insert_users skips the ones taken meanwhile
+    existing = await db_user.get_existing_logins([user.login for _, user in candidates], session)
+    new_users = [(row, user) for row, user in candidates if user.login not in existing]
+    password_hashes = await utils.hash_passwords([user.password for _, user in new_users])
+    inserted = await db_user.insert_users([user.copy(update={'password': password_hash})
+                                           for (_, user), password_hash in zip(new_users, password_hashes)], session)
+    for row, user in candidates:
+        created = user.login in inserted
+        report[row] = users.BulkUserRow(row=row, login=user.login, created=created,
+                                        error=None if created else 'Login already exists')
+    created_users = [user for _, user in new_users if user.login in inserted]
+    if created_users:
+        background_tasks.add_task(utils.notify_about_accounts_creation, created_users)
+    return users.BulkUsersReport(created=len(created_users), failed=len(report) - len(created_users),
+                                 rows=[report[row] for row in sorted(report)])
+
+
 @router.put('/users', response_model=miscs.GenericResponse)
 async def change_user_data(updated_user_data: users.UpdatedUserData,
                            authorized_user: users.User = Depends(utils.get_current_user),
@@ -66,22 +114,42 @@ async def change_user_data(updated_user_data: users.UpdatedUserData,
     return miscs.GenericResponse(result=True)
 
 
+@router.get('/users/batch', response_model=list[users.NoPasswordUser | None])
+async def get_users_batch(ids: list[int] = Query(), authorized_user: users.User = Depends(utils.get_current_user),
+                          session: Connection = Depends(db_misc.get_read_session)):
+    """
+    Gets several users by ids with a single query
+    :param session: Connection object
+    :param ids: user ids, up to settings.BATCH_LOOKUP_MAX_IDS
+    :param authorized_user: schemas.User object
+    :return: list of schemas.NoPasswordUser in the order of ids, null for users not found
+    """
+    if not (authorized_user and authorized_user.check_role('admin')):
+        raise HTTPException(status_code=401)
+    if len(ids) > settings.BATCH_LOOKUP_MAX_IDS:
+        raise HTTPException(status_code=422, detail=f'No more than {settings.BATCH_LOOKUP_MAX_IDS} ids allowed')
+    return await db_user.get_no_password_users_by_ids(ids, session)
+
+
 @router.get('/users/{user_id}', response_model=users.NoPasswordUser)
-async def get_user_info(user_id: int, authorized_user: users.User = Depends(utils.get_current_user),
-                        session: Connection = Depends(db_misc.get_session)):
+async def get_user_info(user_id: int, fields: str = None,
+                        authorized_user: users.User = Depends(utils.get_current_user),
+                        session: Connection = Depends(db_misc.get_read_session)):
     """
     Gets user information by id
     :param session: Connection object
     :param user_id:
+    :param fields: comma separated schemas.NoPasswordUser fields to return, all by default
     :param authorized_user: schemas.User object
     :return: schemas.NoPasswordUser
     """
     if not (authorized_user and authorized_user.check_role('admin')):
         return HTTPException(status_code=401)
-    user = await db_user.get_no_password_user_by_id(user_id, session)
+    fields = utils.parse_fields(fields, users.NoPasswordUser)
+    user = await db_user.get_no_password_user_by_id(user_id, session, fields=fields)
     if not user:
         return HTTPException(status_code=404, detail='User not found')
-    return user
+    return utils.fields_response(user, fields)
 
 
 @router.delete('/users/{user_id}', response_model=miscs.GenericResponse)
@@ -98,3 +166,51 @@ async def delete_user(user_id: int, authorized_user: users.User = Depends(utils.
         return HTTPException(status_code=401)
     await db_user.delete_user(user_id, session)
     return miscs.GenericResponse(result=True)
+
+
+@router.get('/stats/single_flight', response_model=dict[str, dict[str, int]])
+async def get_single_flight_stats(authorized_user: users.User = Depends(utils.get_current_user)):
+    """
+    Gets counters of coalesced DB reads per crud helper
+    :param authorized_user: schemas.User object
+    :return: helper name -> calls, collapsed, in_flight
+    """
+    if not (authorized_user and authorized_user.check_role('admin')):
+        raise HTTPException(status_code=401)
+    return singleflight.get_stats()
+
+
+@router.get('/stats/admission', response_model=dict)
+async def get_admission_stats(authorized_user: users.User = Depends(utils.get_current_user)):
+    """
+    Gets active requests, queue depth and rejections per route class
+    :param authorized_user: schemas.User object
+    :return: admission controller counters
+    """
+    if not (authorized_user and authorized_user.check_role('admin')):
+        raise HTTPException(status_code=401)
+    return admission.controller.stats()
+
+
+@router.get('/stats/replicas', response_model=dict[str, dict])
+async def get_replicas_stats(authorized_user: users.User = Depends(utils.get_current_user)):
+    """
+    Gets health and replication lag in seconds of read replicas
+    :param authorized_user: schemas.User object
+    :return: replica host -> healthy, lag, checked_at, error
+    """
+    if not (authorized_user and authorized_user.check_role('admin')):
+        raise HTTPException(status_code=401)
+    return replicas.get_stats()
+
+
+@router.get('/stats/compression', response_model=dict)
+async def get_compression_stats(authorized_user: users.User = Depends(utils.get_current_user)):
+    """
+    Gets compressed bytes, time spent compressing and hits of the compressed variants cache
+    :param authorized_user: schemas.User object
+    :return: compression counters
+    """
+    if not (authorized_user and authorized_user.check_role('admin')):
+        raise HTTPException(status_code=401)
+    return compression.get_stats()
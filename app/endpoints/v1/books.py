@@ -1,76 +1,173 @@
 from databases.core import Connection
-from fastapi import APIRouter, Depends, HTTPException
+from fastapi import APIRouter, Depends, HTTPException, Query, Request
+from app import settings, snapshot, utils
 from app.crud import book as db_book
 from app.crud import misc as db_misc
-from app.schemas import books
+from app.crud import autocomplete
+from app.schemas import books, miscs
 
 router = APIRouter(prefix="/api/v1/books")
 
 
 @router.get('/', response_model=list[books.Book])
-async def get_books(session: Connection = Depends(db_misc.get_session)):
+async def get_books(fields: str = None, session: Connection = Depends(db_misc.get_read_session)):
     """
     Gives all books
+    :param fields: comma separated schemas.Book fields to return, all by default
     :return: list[schemas.Book]
     """
-    all_books = await db_book.search_books(session)
-    return all_books
+    fields = utils.parse_fields(fields, books.Book)
+    all_books = await db_book.search_books(session, fields=fields)
+    return utils.fields_response(all_books, fields)
+
+
+@router.get('/batch', response_model=list[books.Book | None])
+async def get_books_batch(ids: list[int] = Query(), fields: str = None,
+                          session: Connection = Depends(db_misc.get_read_session)):
+    """
+    Get several books by ids with a single query
+    :param session: Connection object
+    :param ids: book ids, up to settings.BATCH_LOOKUP_MAX_IDS
+    :param fields: comma separated schemas.Book fields to return, all by default
+    :return: list of schemas.Book in the order of ids, null for books not found
+    """
+    if len(ids) > settings.BATCH_LOOKUP_MAX_IDS:
+        raise HTTPException(status_code=422, detail=f'No more than {settings.BATCH_LOOKUP_MAX_IDS} ids allowed')
+    fields = utils.parse_fields(fields, books.Book)
+    found_books = await db_book.get_books_by_ids(ids, session, fields=fields)
+    return utils.fields_response(found_books, fields)
+
+
+@router.get('/facets', response_model=books.Facets)
+async def get_facets(session: Connection = Depends(db_misc.get_read_session)):
+    """
+    Gets number of books per genre, author, publisher and availability
+    :param session: Connection object
+    :return: schemas.Facets
+    """
+    return await db_book.get_facets(session)
+
+
+@router.get('/snapshot')
+async def get_catalogue_snapshot(request: Request):
+    """
+    Gives the whole catalogue as gzipped NDJSON file, one schemas.Book per line.
+    Supports ETag/If-None-Match and Range requests
+    :return: application/gzip file
+    """
+    manifest = snapshot.current_manifest()
+    if not manifest:
+        raise HTTPException(status_code=503, detail='Snapshot is not ready yet', headers={'Retry-After': '5'})
+    return snapshot.snapshot_response(manifest, request.headers)
+
+
+@router.get('/autocomplete/{kind}', response_model=list[miscs.Suggestion])
+async def autocomplete_names(kind: str, q: str = Query(min_length=1, max_length=100),
+                             limit: int = Query(10, ge=1, le=settings.AUTOCOMPLETE_MAX_LIMIT),
+                             fuzzy: bool = False, session: Connection = Depends(db_misc.get_read_session)):
+    """
+    Suggests authors, genres or publishers names for type-ahead
+    :param session: Connection object
+    :param kind: authors, genres or publishers
+    :param q: typed text
+    :param limit: max number of suggestions
+    :param fuzzy: match by trigram similarity instead of prefix
+    :return: list[schemas.Suggestion]
+    """
+    if kind not in autocomplete.TABLES:
+        raise HTTPException(status_code=404, detail='Unknown suggestions kind')
+    if fuzzy:
+        return await autocomplete.suggest_similar(kind, q, limit, session)
+    return await autocomplete.suggest_by_prefix(kind, q, limit, session)
+
+
+@router.get('/changes', response_model=books.BookChanges)
+async def get_book_changes(since: str = '0',
+                           limit: int = Query(settings.CHANGES_PAGE_SIZE, ge=1, le=settings.CHANGES_MAX_PAGE_SIZE),
+                           session: Connection = Depends(db_misc.get_read_session)):
+    """
+    Gets books changed or deleted after the cursor, in commit-safe order.
+    Sync clients start with since=0 and pass next_cursor back until has_more is false
+    :param since: next_cursor of the previous page
+    :param limit: max number of changes
+    :param session: Connection object
+    :return: schemas.BookChanges
+    """
+    try:
+        cursor = books.BookChanges.parse_cursor(since)
+    except ValueError:
+        raise HTTPException(status_code=422, detail='Invalid cursor')
+    return await db_book.get_book_changes(cursor, limit, session)
 
 
 @router.get('/{book_id}', response_model=books.Book)
-async def get_book(book_id: int, session: Connection = Depends(db_misc.get_session)):
+async def get_book(book_id: int, fields: str = None, session: Connection = Depends(db_misc.get_read_session)):
     """
     Get book by its id
     :param session: Connection object
     :param book_id:
+    :param fields: comma separated schemas.Book fields to return, all by default
     :return: schemas.Book
     """
-    book = await db_book.get_book_by_id(book_id, session)
+    fields = utils.parse_fields(fields, books.Book)
+    book = await db_book.get_book_by_id(book_id, session, fields=fields)
     if not book:
         return HTTPException(status_code=404, detail='Book not found')
-    return book
+    return utils.fields_response(book, fields)
 
 
 @router.get('/genre/{genre_id}', response_model=list[books.Book])
-async def search_books_by_genre(genre_id: int, session: Connection = Depends(db_misc.get_session)):
+async def search_books_by_genre(genre_id: int, fields: str = None,
+                                session: Connection = Depends(db_misc.get_read_session)):
     """
     Gets books specified by genre
     :param session: Connection object
     :param genre_id:
+    :param fields: comma separated schemas.Book fields to return, all by default
     :return: list of Book objects
     """
+    fields = utils.parse_fields(fields, books.Book)
     genre = await db_misc.get_genre_by_id(genre_id, session)
     if not genre:
         return HTTPException(status_code=404, detail='Genre not found')
-    all_books = await db_book.search_books(filter_name='genre_id', filter_value=genre.id, session=session)
-    return all_books
+    all_books = await db_book.search_books(filter_name='genre_id', filter_value=genre.id, session=session,
+                                           fields=fields)
+    return utils.fields_response(all_books, fields)
 
 
 @router.get('/publisher/{publisher_id}', response_model=list[books.Book])
-async def search_books_by_publisher(publisher_id: int, session: Connection = Depends(db_misc.get_session)):
+async def search_books_by_publisher(publisher_id: int, fields: str = None,
+                                    session: Connection = Depends(db_misc.get_read_session)):
     """
     Gets books specified by publisher
     :param session: Connection object
     :param publisher_id:
+    :param fields: comma separated schemas.Book fields to return, all by default
     :return: list of Book objects
     """
+    fields = utils.parse_fields(fields, books.Book)
     publisher = await db_misc.get_publisher_by_id(publisher_id, session)
     if not publisher:
         return HTTPException(status_code=404, detail='Publisher not found')
-    all_books = await db_book.search_books(filter_name='publisher_id', filter_value=publisher.id, session=session)
-    return all_books
+    all_books = await db_book.search_books(filter_name='publisher_id', filter_value=publisher.id, session=session,
+                                           fields=fields)
+    return utils.fields_response(all_books, fields)
 
 
 @router.get('/author/{author_id}', response_model=list[books.Book])
-async def search_books_by_author(author_id: int, session: Connection = Depends(db_misc.get_session)):
+async def search_books_by_author(author_id: int, fields: str = None,
+                                 session: Connection = Depends(db_misc.get_read_session)):
     """
     Gets books specified by author
     :param session: Connection object
     :param author_id:
+    :param fields: comma separated schemas.Book fields to return, all by default
     :return: list of Book objects
     """
+    fields = utils.parse_fields(fields, books.Book)
     author = await db_misc.get_author_by_id(author_id, session)
     if not author:
         return HTTPException(status_code=404, detail='Publisher not found')
-    all_books = await db_book.search_books(filter_name='author_id', filter_value=author.id, session=session)
-    return all_books
+    all_books = await db_book.search_books(filter_name='author_id', filter_value=author.id, session=session,
+                                           fields=fields)
+    return utils.fields_response(all_books, fields)
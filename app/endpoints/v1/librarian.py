@@ -1,6 +1,8 @@
+from time import time
 from databases.core import Connection
 from fastapi import APIRouter, Depends, HTTPException
-from app import utils
+from fastapi.responses import StreamingResponse
+from app import settings, utils
 from app.crud import book as db_book
 from app.crud import misc as db_misc
 from app.crud import user as db_user
@@ -112,6 +114,8 @@ async def give_book(book_transaction: miscs.BookGiveTransaction,
         return HTTPException(status_code=403, detail='Book is not in stock')
     book.in_stock = False
     book.owner_id = user.id
+    book.loaned_datetime = int(time())
+    book.due_datetime = book.loaned_datetime + settings.loan_time
     await db_book.update_book(book, session)
     return miscs.GenericResponse(result=True)
 
@@ -137,3 +141,58 @@ async def take_book(book_transaction: miscs.BookGetTransaction,
     book.in_stock = True
     await db_book.update_book(book, session)
     return miscs.GenericResponse(result=True)
+
+
+@router.get('/users/{user_id}/loans', response_model=list[books.Book])
+async def get_user_loans(user_id: int, authorized_user: users.User = Depends(utils.get_current_user),
+                         session: Connection = Depends(db_misc.get_session)):
+    """
+    Gets books currently given to the user
+    :param session: Connection object
+    :param user_id:
+    :param authorized_user: schemas.User object
+    :return: list[schemas.Book]
+    """
+    if not (authorized_user and authorized_user.check_role('librarian')):
+        raise HTTPException(status_code=401)
+    return await db_book.get_books_by_owner(user_id, session)
+
+
+@router.get('/users/{user_id}/reservations', response_model=list[books.Book])
+async def get_user_reservations(user_id: int, authorized_user: users.User = Depends(utils.get_current_user),
+                                session: Connection = Depends(db_misc.get_session)):
+    """
+    Gets books with active reservation by the user
+    :param session: Connection object
+    :param user_id:
+    :param authorized_user: schemas.User object
+    :return: list[schemas.Book]
+    """
+    if not (authorized_user and authorized_user.check_role('librarian')):
+        raise HTTPException(status_code=401)
+    return await db_book.get_books_by_reserver(user_id, session)
+
+
+@router.get('/overdue', response_class=StreamingResponse)
+async def get_overdue_loans(authorized_user: users.User = Depends(utils.get_current_user),
+                            session: Connection = Depends(db_misc.get_read_session)):
+    """
+    Streams books kept past the due date with borrower emails as NDJSON, one schemas.OverdueLoan per line
+    :param session: Connection object
+    :param authorized_user: schemas.User object
+    :return: StreamingResponse
+    """
+    if not (authorized_user and authorized_user.check_role('librarian')):
+        raise HTTPException(status_code=401)
+
+    async def lines():
+        chunk = []
+        async for loan in db_book.iterate_overdue_loans(int(time()), session):
+            chunk.append(loan.json() + '\n')
+            if len(chunk) >= settings.OVERDUE_CHUNK_SIZE:
+                yield ''.join(chunk)
+                chunk = []
+        if chunk:
+            yield ''.join(chunk)
+
+    return StreamingResponse(lines(), media_type='application/x-ndjson')
@@ -3,7 +3,7 @@ from fastapi import APIRouter, Depends, HTTPException
 from app import utils
 from app.crud import book as db_book
 from app.crud import misc as db_misc
-from app.schemas import users, miscs
+from app.schemas import users, miscs, books
 from time import time
 
 
@@ -21,18 +21,15 @@ async def reserve_book(book_id: int, authorized_user: users.User = Depends(utils
     :return: schemas.GenericResponse
     """
     if not (authorized_user and authorized_user.check_role('user')):
-        return HTTPException(status_code=401)
+        raise HTTPException(status_code=401)
+    if await db_book.reserve_book(book_id, authorized_user.id, int(time()), session):
+        return miscs.GenericResponse(result=True)
     book = await db_book.get_book_by_id(book_id, session)
     if not book:
-        return HTTPException(status_code=404, detail='Book not found')
-    if book.is_reserved():
-        return HTTPException(status_code=403, detail='Book is already reserved')
+        raise HTTPException(status_code=404, detail='Book not found')
     if not book.in_stock:
-        return HTTPException(status_code=403, detail='Book is not in stock')
-    book.reserved_datetime = int(time())
-    book.reserved_user_id = authorized_user.id
-    await db_book.update_book(book, session)
-    return miscs.GenericResponse
+        raise HTTPException(status_code=403, detail='Book is not in stock')
+    raise HTTPException(status_code=403, detail='Book is already reserved')
 
 
 @router.get('/unreserve_book/{book_id}', response_model=miscs.GenericResponse)
@@ -46,14 +43,40 @@ async def unreserve_book(book_id: int, authorized_user: users.User = Depends(uti
     :return: schemas.GenericResponse
     """
     if not (authorized_user and authorized_user.check_role('user')):
-        return HTTPException(status_code=401)
+        raise HTTPException(status_code=401)
+    if await db_book.unreserve_book(book_id, authorized_user.id, int(time()), session):
+        return miscs.GenericResponse(result=True)
     book = await db_book.get_book_by_id(book_id, session)
     if not book:
-        return HTTPException(status_code=404, detail='Book not found')
+        raise HTTPException(status_code=404, detail='Book not found')
     if not book.is_reserved():
-        return HTTPException(status_code=403, detail='Book is not reserved')
-    if book.is_reserved() and book.reserved_user_id != authorized_user.id:
-        return HTTPException(status_code=403, detail='Book is reserved by another user')
-    book.reserved_datetime = 0
-    await db_book.update_book(book, session)
-    return miscs.GenericResponse(result=True)
+        raise HTTPException(status_code=403, detail='Book is not reserved')
+    raise HTTPException(status_code=403, detail='Book is reserved by another user')
+
+
+@router.get('/loans', response_model=list[books.Book])
+async def get_loans(authorized_user: users.User = Depends(utils.get_current_user),
+                    session: Connection = Depends(db_misc.get_session)):
+    """
+    Gets books currently given to the user
+    :param session: Connection object
+    :param authorized_user: schemas.User object
+    :return: list[schemas.Book]
+    """
+    if not (authorized_user and authorized_user.check_role('user')):
+        raise HTTPException(status_code=401)
+    return await db_book.get_books_by_owner(authorized_user.id, session)
+
+
+@router.get('/reservations', response_model=list[books.Book])
+async def get_reservations(authorized_user: users.User = Depends(utils.get_current_user),
+                           session: Connection = Depends(db_misc.get_session)):
+    """
+    Gets books with active reservation by the user
+    :param session: Connection object
+    :param authorized_user: schemas.User object
+    :return: list[schemas.Book]
+    """
+    if not (authorized_user and authorized_user.check_role('user')):
+        raise HTTPException(status_code=401)
+    return await db_book.get_books_by_reserver(authorized_user.id, session)
@@ -1,12 +1,21 @@
 from asyncpg import PostgresError
 from fastapi import FastAPI
 from app.endpoints.v1 import admin, user, books, librarian, authorization
-from app.crud.misc import get_session
+from app.crud.book import ensure_facets
+from app.crud.misc import get_session, database
 from app.db.models import Base, engine
+from app.db import notifications, replicas
+from app import admission, compression, settings, snapshot, utils
+import asyncio
 import sys
 
 
 app = FastAPI()
+background_tasks: list[asyncio.Task] = []
+if settings.ADMISSION_ENABLED:
+    app.add_middleware(admission.AdmissionMiddleware)
+if settings.COMPRESSION_ENABLED:
+    app.add_middleware(compression.CompressionMiddleware)
 app.include_router(admin.router)
 app.include_router(librarian.router)
 app.include_router(user.router)
@@ -16,11 +25,36 @@ app.include_router(authorization.router)
 
 @app.on_event('startup')
 async def startup():
+    if settings.STORAGE_BACKEND == 'memory':
+        return
     Base.metadata.create_all(engine)
+    # the sync engine is used only here, its idle connection must not count against DB_CONNECTION_BUDGET
+    engine.dispose()
     try:
+        await database.connect()
         async for session in get_session():
             check = await session.fetch_one("SELECT 1;")
             print(check)
+            if await ensure_facets(session):
+                print("book_facets rebuilt")
+        await notifications.start_listener()
     except PostgresError:
         print("DB connection error")
-        sys.exit(1)
\ No newline at end of file
+        sys.exit(1)
+    background_tasks.append(asyncio.create_task(notifications.run_listener()))
+    if replicas.replicas:
+        background_tasks.append(asyncio.create_task(replicas.run_health_checks()))
+    if settings.SNAPSHOT_ENABLED:
+        background_tasks.append(asyncio.create_task(snapshot.run_scheduler()))
+
+
+@app.on_event('shutdown')
+async def shutdown():
+    for task in background_tasks:
+        task.cancel()
+    utils.shutdown_hash_pool()
+    if settings.STORAGE_BACKEND == 'memory':
+        return
+    await notifications.stop_listener()
+    await replicas.disconnect()
+    await database.disconnect()
\ No newline at end of file
@@ -13,6 +13,8 @@ class UpdatedBookData(BaseModel):
     reserved_user_id: int = None
     in_stock: bool = None
     owner_id: int = None
+    loaned_datetime: int = None
+    due_datetime: int = None
 
 
 class Book(BaseModel):
@@ -25,6 +27,8 @@ class Book(BaseModel):
     reserved_user_id: int = None
     in_stock: bool
     owner_id: int = None
+    loaned_datetime: int = None
+    due_datetime: int = None
 
     class Config:
         orm_mode = True
@@ -41,3 +45,58 @@ class NewBookData(BaseModel):
     author_id: int = None
     publisher_id: int = None
     genre_id: int = None
+
+
+class FacetCount(BaseModel):
+    id: int
+    name: str = None
+    count: int
+
+
+class Facets(BaseModel):
+    genres: list[FacetCount] = []
+    authors: list[FacetCount] = []
+    publishers: list[FacetCount] = []
+    in_stock: int = 0
+    given_out: int = 0
+
+
+class BookChange(BaseModel):
+    seq: int
+    id: int
+    deleted: bool
+    book: Book = None
+
+
+class BookChanges(BaseModel):
+    changes: list[BookChange]
+    next_cursor: str
+    has_more: bool
+
+    @staticmethod
+    def make_cursor(xid: int, seq: int) -> str:
+        return f'{xid}-{seq}'
+
+    @staticmethod
+    def parse_cursor(cursor: str) -> tuple[int, int]:
+        """'<change_xid>-<change_seq>', '0' for the beginning; ValueError for malformed cursors"""
+        if cursor == '0':
+            return 0, 0
+        xid, seq = cursor.split('-')
+        xid, seq = int(xid), int(seq)
+        if xid < 0 or seq < 0:
+            raise ValueError(cursor)
+        return xid, seq
+
+
+class OverdueLoan(BaseModel):
+    book_id: int
+    book_name: str
+    user_id: int
+    login: str
+    email: str
+    loaned_datetime: int = None
+    due_datetime: int
+
+    class Config:
+        orm_mode = True
@@ -25,6 +25,14 @@ class Publisher(BaseModel):
         orm_mode = True
 
 
+class Suggestion(BaseModel):
+    id: int
+    name: str
+
+    class Config:
+        orm_mode = True
+
+
 class Authorization(BaseModel):
     login: str
     password: str
@@ -41,3 +41,16 @@ class NewUserData(BaseModel):
     login: str
     password: str
     role: str
+
+
+class BulkUserRow(BaseModel):
+    row: int
+    login: str = None
+    created: bool
+    error: str = None
+
+
+class BulkUsersReport(BaseModel):
+    created: int
+    failed: int
+    rows: list[BulkUserRow]
@@ -7,6 +7,80 @@ DB_NAME = os.environ.get('DB_NAME', 'postgres')
 DB_PORT = os.environ.get('DB_PORT', 5432)
 postgre_url = f'postgresql://{DB_USER}:{DB_PASSWORD}@db/{DB_NAME}'
 print(postgre_url)
+# postgres or memory, the latter keeps everything in process for tests and benchmarks
+STORAGE_BACKEND = os.environ.get('STORAGE_BACKEND', 'postgres')
+# comma separated host:port list of streaming replicas used for read-only routes
+DB_REPLICAS = os.environ.get('DB_REPLICAS', '')
+replica_urls = [f'postgresql://{DB_USER}:{DB_PASSWORD}@{host.strip()}/{DB_NAME}'
+                for host in DB_REPLICAS.split(',') if host.strip()]
+REPLICA_MAX_LAG = float(os.environ.get('REPLICA_MAX_LAG', 10))
+REPLICA_HEALTH_INTERVAL = float(os.environ.get('REPLICA_HEALTH_INTERVAL', 5))
+
+
+"""config for server workers and DB pool"""
+WEB_WORKERS = int(os.environ.get('WEB_WORKERS', os.cpu_count() or 1))
+DB_CONNECTION_BUDGET = int(os.environ.get('DB_CONNECTION_BUDGET', 90))
+# one connection per worker is kept for LISTEN/NOTIFY invalidation channel
+DB_POOL_MAX_SIZE = int(os.environ.get('DB_POOL_MAX_SIZE', max(1, DB_CONNECTION_BUDGET // WEB_WORKERS - 1)))
+DB_POOL_MIN_SIZE = int(os.environ.get('DB_POOL_MIN_SIZE', min(2, DB_POOL_MAX_SIZE)))
+# every worker forks its own bcrypt process pool, together they share the host cores
+HASH_POOL_WORKERS = int(os.environ.get('HASH_POOL_WORKERS', max(1, (os.cpu_count() or 1) // WEB_WORKERS)))
+# LISTEN connection is checked every LISTENER_HEALTH_INTERVAL seconds and reconnected with backoff
+LISTENER_HEALTH_INTERVAL = float(os.environ.get('LISTENER_HEALTH_INTERVAL', 10))
+LISTENER_RECONNECT_MAX_DELAY = float(os.environ.get('LISTENER_RECONNECT_MAX_DELAY', 30))
+
+
+
+"""config for admission control"""
+ADMISSION_ENABLED = os.environ.get('ADMISSION_ENABLED', '1') == '1'
+ADMISSION_MAX_CONCURRENCY = int(os.environ.get('ADMISSION_MAX_CONCURRENCY', DB_POOL_MAX_SIZE))
+ADMISSION_QUEUE_SIZE = int(os.environ.get('ADMISSION_QUEUE_SIZE', 100))
+ADMISSION_MAX_WAIT = float(os.environ.get('ADMISSION_MAX_WAIT', 2.0))
+
+
+"""config for request coalescing of hot reads"""
+SINGLE_FLIGHT_ENABLED = os.environ.get('SINGLE_FLIGHT_ENABLED', '1') == '1'
+
+BATCH_LOOKUP_MAX_IDS = int(os.environ.get('BATCH_LOOKUP_MAX_IDS', 100))
+
+
+
+"""config for catalogue snapshot"""
+SNAPSHOT_ENABLED = os.environ.get('SNAPSHOT_ENABLED', '1') == '1'
+SNAPSHOT_DIR = os.environ.get('SNAPSHOT_DIR', '/tmp/library_snapshots')
+SNAPSHOT_MIN_INTERVAL = float(os.environ.get('SNAPSHOT_MIN_INTERVAL', 60))
+SNAPSHOT_COMPRESSLEVEL = int(os.environ.get('SNAPSHOT_COMPRESSLEVEL', 9))
+SNAPSHOT_KEEP = int(os.environ.get('SNAPSHOT_KEEP', 2))
+# internal nginx location mapped to SNAPSHOT_DIR, e.g. /protected/snapshots
+SNAPSHOT_ACCEL_REDIRECT = os.environ.get('SNAPSHOT_ACCEL_REDIRECT')
+
+
+
+"""config for autocomplete"""
+AUTOCOMPLETE_IN_MEMORY = os.environ.get('AUTOCOMPLETE_IN_MEMORY', '1') == '1'
+AUTOCOMPLETE_MAX_LIMIT = int(os.environ.get('AUTOCOMPLETE_MAX_LIMIT', 50))
+
+
+"""config for response compression"""
+COMPRESSION_ENABLED = os.environ.get('COMPRESSION_ENABLED', '1') == '1'
+COMPRESSION_MIN_SIZE = int(os.environ.get('COMPRESSION_MIN_SIZE', 1024))
+COMPRESSION_GZIP_LEVEL = int(os.environ.get('COMPRESSION_GZIP_LEVEL', 6))
+COMPRESSION_BROTLI_QUALITY = int(os.environ.get('COMPRESSION_BROTLI_QUALITY', 5))
+COMPRESSION_CACHE_MAX_BYTES = int(os.environ.get('COMPRESSION_CACHE_MAX_BYTES', 32 * 1024 * 1024))
+
+
+"""config for bulk user provisioning"""
+BULK_USERS_MAX_ROWS = int(os.environ.get('BULK_USERS_MAX_ROWS', 10000))
+BULK_INSERT_BATCH = int(os.environ.get('BULK_INSERT_BATCH', 1000))
+
+
+"""config for catalogue change feed"""
+CHANGES_PAGE_SIZE = int(os.environ.get('CHANGES_PAGE_SIZE', 500))
+CHANGES_MAX_PAGE_SIZE = int(os.environ.get('CHANGES_MAX_PAGE_SIZE', 5000))
+
+
+"""config for overdue report"""
+OVERDUE_CHUNK_SIZE = int(os.environ.get('OVERDUE_CHUNK_SIZE', 500))
 
 
 """config for emails"""
@@ -22,3 +96,4 @@ ALGORITHM = "HS256"
 ACCESS_TOKEN_EXPIRE_MINUTES = 30
 
 reservation_time = 60 * 60
+loan_time = 14 * 24 * 60 * 60
@@ -0,0 +1,188 @@
+import asyncio
+import gzip
+import hashlib
+import json
+import logging
+import mmap
+import os
+import time
+import uuid
+from fastapi import HTTPException
+from fastapi.responses import Response, FileResponse, StreamingResponse
+from starlette.datastructures import Headers
+from app import settings
+from app.crud.misc import database
+from app.crud import book as db_book
+from app.db import notifications
+from app.schemas import books
+
+
+"""Precompressed NDJSON snapshot of the whole catalogue, regenerated when books change"""
+logger = logging.getLogger(__name__)
+MANIFEST_NAME = 'catalogue.json'
+SNAPSHOT_LOCK_KEY = 7_130_221
+CHUNK_SIZE = 64 * 1024
+WRITE_BATCH = 1000
+
+changed = asyncio.Event()
+manifest_cache: dict = {}
+
+
+def on_books_changed(payload: str):
+    changed.set()
+
+
+notifications.subscribe(notifications.BOOKS_CHANNEL, on_books_changed)
+
+
+def manifest_path() -> str:
+    return os.path.join(settings.SNAPSHOT_DIR, MANIFEST_NAME)
+
+
+def current_manifest() -> dict | None:
+    """Reads manifest of the latest snapshot, cached until the file is replaced"""
+    try:
+        mtime = os.stat(manifest_path()).st_mtime_ns
+    except FileNotFoundError:
+        return
+    if manifest_cache.get('mtime') != mtime:
+        with open(manifest_path()) as file:
+            manifest_cache.update(mtime=mtime, manifest=json.load(file))
+    return manifest_cache['manifest']
+
+
+async def write_snapshot(session) -> dict | None:
+    """
+    Streams books from a server-side cursor into a gzipped NDJSON file
+    :param session: DB connection session
+    :return: new manifest, None if the catalogue didn't change
+    """
+    os.makedirs(settings.SNAPSHOT_DIR, exist_ok=True)
+    tmp_path = os.path.join(settings.SNAPSHOT_DIR, f'.catalogue-{uuid.uuid4().hex}.tmp')
+    digest = hashlib.sha256()
+    count = 0
+    query = f'''SELECT {db_book.select_columns()} FROM books ORDER BY id;'''
+    try:
+        with open(tmp_path, 'wb') as raw, gzip.GzipFile(fileobj=raw, mode='wb', mtime=0,
+                                                      compresslevel=settings.SNAPSHOT_COMPRESSLEVEL) as file:
+            lines = []
+            async for item in session.iterate(query=query):
+                lines.append(books.Book.from_orm(item).json() + '\n')
+                count += 1
+                if len(lines) >= WRITE_BATCH:
+                    chunk = ''.join(lines).encode()
+                    digest.update(chunk)
+                    await asyncio.to_thread(file.write, chunk)
+                    lines = []
+            chunk = ''.join(lines).encode()
+            digest.update(chunk)
+            await asyncio.to_thread(file.write, chunk)
+        etag = digest.hexdigest()[:32]
+        manifest = current_manifest()
+        if manifest and manifest['etag'] == etag:
+            os.remove(tmp_path)
+            return
+        file_name = f'catalogue-{etag}.ndjson.gz'
+        os.replace(tmp_path, os.path.join(settings.SNAPSHOT_DIR, file_name))
+    except BaseException:
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+        raise
+    manifest = {'file': file_name, 'etag': etag, 'books': count, 'generated_at': int(time.time()),
+                'size': os.path.getsize(os.path.join(settings.SNAPSHOT_DIR, file_name))}
+    manifest_tmp = manifest_path() + '.tmp'
+    with open(manifest_tmp, 'w') as file:
+        json.dump(manifest, file)
+    os.replace(manifest_tmp, manifest_path())
+    remove_old_snapshots(file_name)
+    return manifest
+
+
+def remove_old_snapshots(current_file: str):
+    snapshots = sorted((entry for entry in os.scandir(settings.SNAPSHOT_DIR)
+                        if entry.name.startswith('catalogue-') and entry.name != current_file),
+                       key=lambda entry: entry.stat().st_mtime, reverse=True)
+    # previous versions are kept for a while so downloads in progress can finish
+    for entry in snapshots[settings.SNAPSHOT_KEEP - 1:]:
+        os.remove(entry.path)
+
+
+async def refresh():
+    """Regenerates snapshot unless another worker holds the snapshot lock"""
+    async with database.connection() as session:
+        locked = await session.fetch_val('''SELECT pg_try_advisory_lock(:key);''', {'key': SNAPSHOT_LOCK_KEY})
+        if not locked:
+            return
+        try:
+            await write_snapshot(session)
+        finally:
+            await session.fetch_val('''SELECT pg_advisory_unlock(:key);''', {'key': SNAPSHOT_LOCK_KEY})
+
+
+async def run_scheduler():
+    """Regenerates snapshot on books changes, at most once per settings.SNAPSHOT_MIN_INTERVAL"""
+    changed.set()
+    while True:
+        await changed.wait()
+        changed.clear()
+        try:
+            await refresh()
+        except Exception:
+            logger.exception('Catalogue snapshot failed')
+        await asyncio.sleep(settings.SNAPSHOT_MIN_INTERVAL)
+
+
+def parse_range(range_header: str, size: int) -> tuple[int, int] | None:
+    """Parses a single 'bytes=start-end' range, returns inclusive bounds"""
+    unit, _, spec = range_header.partition('=')
+    if unit.strip() != 'bytes' or ',' in spec:
+        return
+    start, _, end = spec.strip().partition('-')
+    try:
+        if not start:
+            length = int(end)
+            if length <= 0:
+                raise ValueError
+            return max(0, size - length), size - 1
+        start, end = int(start), int(end) if end else size - 1
+    except ValueError:
+        raise HTTPException(status_code=416, headers={'Content-Range': f'bytes */{size}'})
+    if start > end or start >= size:
+        raise HTTPException(status_code=416, headers={'Content-Range': f'bytes */{size}'})
+    return start, min(end, size - 1)
+
+
+def read_mapped(path: str, start: int, end: int):
+    with open(path, 'rb') as file, mmap.mmap(file.fileno(), 0, access=mmap.ACCESS_READ) as mapped:
+        for offset in range(start, end + 1, CHUNK_SIZE):
+            yield mapped[offset:min(offset + CHUNK_SIZE, end + 1)]
+
+
+def snapshot_response(manifest: dict, request_headers: Headers) -> Response:
+    """
+    Builds response for the snapshot file with ETag, If-None-Match and single Range support
+    :param manifest: current snapshot manifest
+    :param request_headers: incoming request headers
+    :return: 200, 206 or 304 response
+    """
+    etag = f'"{manifest["etag"]}"'
+    path = os.path.join(settings.SNAPSHOT_DIR, manifest['file'])
+    size = manifest['size']
+    headers = {'ETag': etag, 'Accept-Ranges': 'bytes', 'Cache-Control': 'public, max-age=60',
+               'Content-Disposition': f'attachment; filename="{manifest["file"]}"'}
+    if etag in request_headers.get('if-none-match', ''):
+        return Response(status_code=304, headers=headers)
+    byte_range = None
+    if 'range' in request_headers and request_headers.get('if-range', etag) == etag:
+        byte_range = parse_range(request_headers['range'], size)
+    if byte_range is None and settings.SNAPSHOT_ACCEL_REDIRECT:
+        # fronting nginx sends the file itself with sendfile
+        headers['X-Accel-Redirect'] = f'{settings.SNAPSHOT_ACCEL_REDIRECT.rstrip("/")}/{manifest["file"]}'
+        return Response(headers=headers, media_type='application/gzip')
+    if byte_range is None:
+        return FileResponse(path, headers=headers, media_type='application/gzip')
+    start, end = byte_range
+    headers['Content-Range'] = f'bytes {start}-{end}/{size}'
+    headers['Content-Length'] = str(end - start + 1)
+    return StreamingResponse(read_mapped(path, start, end), status_code=206, headers=headers,
+                             media_type='application/gzip')
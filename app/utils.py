@@ -1,7 +1,15 @@
+import asyncio
+import csv
+import io
+import json
+import math
+from concurrent.futures import ProcessPoolExecutor
 from datetime import timedelta, datetime
 import jwt
 from databases.core import Connection
-from fastapi import Depends
+from fastapi import Depends, HTTPException
+from fastapi.responses import JSONResponse
+from pydantic import BaseModel, ValidationError
 from fastapi.security import OAuth2PasswordBearer
 from passlib.context import CryptContext
 from passlib.hash import bcrypt
@@ -13,6 +21,8 @@ from app.crud.user import get_user_by_login
 
 pwd_context = CryptContext(schemes=["bcrypt"], deprecated="auto")
 oauth2_scheme = OAuth2PasswordBearer(tokenUrl="authorization/token")
+hash_pool: ProcessPoolExecutor | None = None
+USER_COLUMN_LENGTH = 50
 
 
 def get_password_hash(password: str) -> str:
@@ -20,20 +30,70 @@ def get_password_hash(password: str) -> str:
     return password_hash
 
 
-def notify_about_account_creation(user: users.NewUserData):
-    msg = f'''Your account has been created
+def hash_passwords_chunk(passwords: list[str]) -> list[str]:
+    return [bcrypt.hash(password) for password in passwords]
+
+
+def get_hash_pool() -> ProcessPoolExecutor:
+    global hash_pool
+    if hash_pool is None:
+        hash_pool = ProcessPoolExecutor(max_workers=settings.HASH_POOL_WORKERS)
+    return hash_pool
+
+
+def shutdown_hash_pool():
+    global hash_pool
+    if hash_pool is not None:
+        hash_pool.shutdown(cancel_futures=True)
+        hash_pool = None
+
+
+async def hash_passwords(passwords: list[str]) -> list[str]:
+    """
+    Hashes passwords in chunks across the process pool, keeping bcrypt off the event loop
+    :param passwords: plain passwords
+    :return: hashes in the same order
+    """
+    if not passwords:
+        return []
+    loop = asyncio.get_running_loop()
+    chunk_size = math.ceil(len(passwords) / (settings.HASH_POOL_WORKERS * 4))
+    chunks = await asyncio.gather(*(loop.run_in_executor(get_hash_pool(), hash_passwords_chunk,
+                                                         passwords[start:start + chunk_size])
+                                    for start in range(0, len(passwords), chunk_size)))
+    return [password_hash for chunk in chunks for password_hash in chunk]
+
+
+def account_creation_message(user: users.NewUserData) -> str:
+    return f'''Your account has been created
 Data for authorization
 Login: {user.login},
 Password: {user.password}'''
-    send_email_to_user(user.email, msg)
+
+
+def notify_about_account_creation(user: users.NewUserData):
+    send_email_to_user(user.email, account_creation_message(user))
+
+
+def notify_about_accounts_creation(new_users: list[users.NewUserData]):
+    """Sends all messages over one SMTP connection"""
+    send_emails([(user.email, account_creation_message(user)) for user in new_users])
 
 
 def send_email_to_user(user_email: str, message: str):
+    send_emails([(user_email, message)])
+
+
+def send_emails(messages: list[tuple[str, str]]):
+    """
+    :param messages: list of (user email, message)
+    """
     email_controller = SMTP()
     email_controller.connect(settings.EMAIL_DOMEN_NAME, settings.EMAIL_PORT)
     email_controller.starttls()
     email_controller.login(settings.EMAIL_LOGIN, settings.EMAIL_PASSWORD)
-    email_controller.sendmail(settings.EMAIL_LOGIN, user_email, message)
+    for user_email, message in messages:
+        email_controller.sendmail(settings.EMAIL_LOGIN, user_email, message)
     email_controller.quit()
 
 
@@ -58,11 +118,71 @@ def create_access_token(data: dict) -> str:
     return encoded_jwt
 
 
+def parse_bulk_users(content: bytes, filename: str | None,
+                     content_type: str | None) -> list[tuple[int, users.NewUserData | str]]:
+    """
+    Parses users file: JSON array of objects or CSV with header email,login,password,role
+    :param content: file content
+    :param filename: uploaded file name
+    :param content_type: uploaded file content type
+    :return: list of (row number starting from 1, schemas.NewUserData or error message)
+    """
+    try:
+        text = content.decode('utf-8-sig')
+        if (filename or '').lower().endswith('.json') or (content_type or '').startswith('application/json'):
+            records = json.loads(text)
+            if not isinstance(records, list):
+                raise ValueError('JSON file must contain an array of users')
+        else:
+            records = list(csv.DictReader(io.StringIO(text)))
+    except (UnicodeDecodeError, ValueError, csv.Error) as error:
+        raise HTTPException(status_code=422, detail=f'Invalid users file: {error}')
+    if len(records) > settings.BULK_USERS_MAX_ROWS:
+        raise HTTPException(status_code=422, detail=f'Too many rows, max {settings.BULK_USERS_MAX_ROWS}')
+    rows = []
+    for row, record in enumerate(records, start=1):
+        try:
+            user = users.NewUserData.parse_obj(record)
+        except ValidationError as error:
+            rows.append((row, ', '.join(f'{".".join(map(str, item["loc"]))}: {item["msg"]}'
+                                        for item in error.errors())))
+            continue
+        if not (user.email and user.login and user.password and user.role):
+            rows.append((row, 'Values must not be empty'))
+            continue
+        if max(len(user.email), len(user.login), len(user.role)) > USER_COLUMN_LENGTH:
+            rows.append((row, f'Values must be at most {USER_COLUMN_LENGTH} characters'))
+            continue
+        rows.append((row, user))
+    return rows
+
+
 def unite_dicts(main_dict: dict, new_dict: dict) -> dict:
     new_dict = {item: new_dict.get(item) for item in new_dict if new_dict.get(item) is not None}
     return main_dict | new_dict
 
 
+def parse_fields(fields: str | None, schema: type[BaseModel]) -> tuple[str, ...] | None:
+    """
+    Parses sparse fieldset parameter like 'id,name,in_stock'
+    :param fields: comma separated field names or None for all fields
+    :param schema: pydantic model the fields must belong to
+    :return: tuple of unique field names in schema order or None
+    """
+    if not fields:
+        return
+    requested = {field.strip() for field in fields.split(',') if field.strip()}
+    unknown = requested - schema.__fields__.keys()
+    if unknown:
+        raise HTTPException(status_code=422, detail=f'Unknown fields: {", ".join(sorted(unknown))}')
+    return tuple(field for field in schema.__fields__ if field in requested) or None
+
+
+def fields_response(result, fields: tuple[str, ...] | None):
+    """Sends trimmed rows as is, bypassing response_model validation which requires all fields"""
+    return JSONResponse(result) if fields else result
+
+
 async def get_current_user(token: str = Depends(oauth2_scheme), session: Connection = Depends(get_session)):
     """
     :param token: JWT
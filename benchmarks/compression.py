@@ -0,0 +1,108 @@
+"""
+Bandwidth and CPU cost of response compression on a large catalogue.
+
+Seeds the in-memory engine, serves the app from a uvicorn thread and requests the large list endpoints
+with every supported Accept-Encoding, first with the compressed variants cache disabled, then enabled.
+Reports wire bytes, mean latency and server time spent compressing per request.
+
+Usage:
+    STORAGE_BACKEND=memory python -m benchmarks.compression --books 50000 --requests 50 --output compression.json
+"""
+import argparse
+import asyncio
+import json
+import random
+import time
+import requests
+from passlib.hash import bcrypt
+from app import compression, settings
+from app.crud import memory
+from app.crud import user as db_user
+from app.schemas import users
+from benchmarks.load_test import BENCH_PASSWORD, BENCH_PREFIX, seed_memory, memory_fixture_ids, \
+    start_in_process_server, current_commit
+
+ADMIN_LOGIN = f'{BENCH_PREFIX}-admin'
+
+
+def endpoints(fixture: dict) -> dict[str, str]:
+    return {'GET /api/v1/books/': '/api/v1/books/',
+            'GET /api/v1/books/genre/{genre_id}': f'/api/v1/books/genre/{fixture["genres"][0]}',
+            'GET /api/v1/books/author/{author_id}': f'/api/v1/books/author/{fixture["authors"][0]}',
+            'GET /api/v1/books/publisher/{publisher_id}': f'/api/v1/books/publisher/{fixture["publishers"][0]}',
+            'GET /api/v1/admin/users': '/api/v1/admin/users'}
+
+
+def measure(http: requests.Session, url: str, headers: dict, count: int) -> dict:
+    """Mean wire bytes, latency and compression time per request"""
+    compress_seconds = compression.counters.compress_seconds
+    wire_bytes = 0
+    start = time.perf_counter()
+    for _ in range(count):
+        response = http.get(url, headers=headers)
+        response.raise_for_status()
+        wire_bytes += int(response.headers.get('content-length', len(response.content)))
+    elapsed = time.perf_counter() - start
+    return {'wire_bytes': wire_bytes // count,
+            'mean_ms': round(elapsed / count * 1000, 3),
+            'compress_ms': round((compression.counters.compress_seconds - compress_seconds) / count * 1000, 3)}
+
+
+def run(books_count: int, users_count: int, count: int, port: int) -> dict:
+    random.seed(0)
+    asyncio.run(seed_memory(books_count, users_count, 1))
+    asyncio.run(db_user.insert_user(users.NewUserData(email=f'{ADMIN_LOGIN}@example.com', login=ADMIN_LOGIN,
+                                                      password=bcrypt.hash(BENCH_PASSWORD), role='admin'),
+                                    memory.storage))
+    server = start_in_process_server(port)
+    base_url = f'http://127.0.0.1:{port}'
+    http = requests.Session()
+    token = http.post(f'{base_url}/authorization/token',
+                      data={'username': ADMIN_LOGIN, 'password': BENCH_PASSWORD}).json()['access_token']
+    cache_max_bytes = compression.cache.max_bytes
+    results = {}
+    try:
+        for name, path in endpoints(memory_fixture_ids()).items():
+            headers = {'Authorization': f'Bearer {token}'} if '/admin/' in path else {}
+            results[name] = {}
+            for encoding in ('identity', *compression.available_encodings()):
+                request_headers = {**headers, 'Accept-Encoding': encoding}
+                compression.cache.max_bytes = 0
+                uncached = measure(http, base_url + path, request_headers, count)
+                compression.cache.max_bytes = cache_max_bytes
+                cached = measure(http, base_url + path, request_headers, count)
+                results[name][encoding] = {'uncached': uncached, 'cached': cached}
+    finally:
+        compression.cache.max_bytes = cache_max_bytes
+        server.should_exit = True
+    return {'commit': current_commit(), 'timestamp': int(time.time()),
+            'config': {'books': books_count, 'users': users_count, 'requests': count,
+                       'min_size': settings.COMPRESSION_MIN_SIZE, 'gzip_level': settings.COMPRESSION_GZIP_LEVEL,
+                       'brotli_quality': settings.COMPRESSION_BROTLI_QUALITY},
+            'endpoints': results, 'server': compression.get_stats()}
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--books', type=int, default=50000)
+    parser.add_argument('--users', type=int, default=5000)
+    parser.add_argument('--requests', type=int, default=50)
+    parser.add_argument('--port', type=int, default=8766)
+    parser.add_argument('--output', default='compression.json')
+    args = parser.parse_args()
+    if settings.STORAGE_BACKEND != 'memory':
+        raise SystemExit('Run with STORAGE_BACKEND=memory')
+    result = run(args.books, args.users, args.requests, args.port)
+    with open(args.output, 'w') as file:
+        json.dump(result, file, indent=2)
+    for name, encodings in result['endpoints'].items():
+        identity = encodings['identity']['uncached']['wire_bytes']
+        for encoding, stats in encodings.items():
+            print(f'{name:45} {encoding:9} {stats["uncached"]["wire_bytes"]:>10} B '
+                  f'({stats["uncached"]["wire_bytes"] / identity:.1%})  '
+                  f'uncached {stats["uncached"]["mean_ms"]:>8} ms (compress {stats["uncached"]["compress_ms"]:>7} ms)  '
+                  f'cached {stats["cached"]["mean_ms"]:>8} ms (compress {stats["cached"]["compress_ms"]:>7} ms)')
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,363 @@
+"""
+Load-test and benchmark harness for the library API.
+
+Seeds the database configured in app.settings with a synthetic catalogue and user base,
+drives a running server concurrently and reports throughput and latency percentiles
+per endpoint. Results are saved as JSON so runs from different commits can be compared.
+
+With STORAGE_BACKEND=memory the "run" command seeds the in-memory engine and serves the app
+from a uvicorn thread inside the benchmark process, no Postgres needed.
+
+Usage:
+    STORAGE_BACKEND=memory python -m benchmarks.load_test run --books 10000 --users 1000 --duration 30
+    python -m benchmarks.load_test seed --books 10000 --users 1000
+    python -m benchmarks.load_test run --url http://0.0.0.0:8000 --duration 30 --output result.json
+    python -m benchmarks.load_test compare baseline.json result.json --threshold 0.1
+"""
+import argparse
+import asyncio
+import json
+import random
+import subprocess
+import sys
+import threading
+import time
+from collections import defaultdict
+from concurrent.futures import ThreadPoolExecutor
+import requests
+import uvicorn
+from databases.core import Database
+from passlib.hash import bcrypt
+from app import settings
+from app.settings import postgre_url
+from app.db.start_database import create_tables
+from app.crud import book as db_book
+from app.crud import misc as db_misc
+from app.crud import user as db_user
+from app.crud import memory
+from app.crud.book import rebuild_facets
+from app.schemas import books, users
+
+BENCH_PASSWORD = 'bench-password'
+BENCH_PREFIX = 'bench'
+BATCH_SIZE = 1000
+
+
+async def seed(books_count: int, users_count: int, librarians_count: int, reset: bool = False):
+    """
+    Fills the database with synthetic authors, genres, publishers, books and users
+    :param books_count: number of books to create
+    :param users_count: number of users with 'user' role to create
+    :param librarians_count: number of users with 'librarian' role to create
+    :param reset: delete previously seeded benchmark rows first
+    """
+    password_hash = bcrypt.hash(BENCH_PASSWORD)
+    async with Database(postgre_url) as db, db.connection() as session:
+        await create_tables(session)
+        if reset:
+            await session.execute(f'''INSERT INTO book_tombstones(book_id) SELECT id FROM books
+            WHERE name LIKE '{BENCH_PREFIX}-%' ON CONFLICT (book_id)
+            DO UPDATE SET change_seq = nextval('book_changes_seq'), change_xid = pg_current_xact_id();''')
+            await session.execute(f'''DELETE FROM books WHERE name LIKE '{BENCH_PREFIX}-%';''')
+            await session.execute(f'''DELETE FROM users WHERE login LIKE '{BENCH_PREFIX}-%';''')
+        for table, count in (('authors', 200), ('genres', 20), ('publishers', 50)):
+            query = f'''INSERT INTO {table} (name) VALUES (:name) ON CONFLICT DO NOTHING;'''
+            await session.execute_many(query=query, values=[
+                {'name': f'{BENCH_PREFIX}-{table}-{i}'} for i in range(count)])
+        ids = {}
+        for table in ('authors', 'genres', 'publishers'):
+            rows = await session.fetch_all(f'''SELECT id FROM {table} WHERE name LIKE '{BENCH_PREFIX}-%';''')
+            ids[table] = [row[0] for row in rows]
+        query = '''INSERT INTO books(name, author_id, publisher_id, genre_id)
+        VALUES(:name, :author_id, :publisher_id, :genre_id) ON CONFLICT DO NOTHING;'''
+        for start in range(0, books_count, BATCH_SIZE):
+            values = [{'name': f'{BENCH_PREFIX}-book-{i}',
+                       'author_id': random.choice(ids['authors']),
+                       'publisher_id': random.choice(ids['publishers']),
+                       'genre_id': random.choice(ids['genres'])}
+                      for i in range(start, min(start + BATCH_SIZE, books_count))]
+            await session.execute_many(query=query, values=values)
+        await rebuild_facets(session)
+        query = '''INSERT INTO users(email, login, password_hash, role)
+        VALUES(:email, :login, :password_hash, :role) ON CONFLICT DO NOTHING;'''
+        for role, count in (('user', users_count), ('librarian', librarians_count)):
+            for start in range(0, count, BATCH_SIZE):
+                values = [{'email': f'{BENCH_PREFIX}-{role}-{i}@example.com',
+                           'login': f'{BENCH_PREFIX}-{role}-{i}',
+                           'password_hash': password_hash,
+                           'role': role}
+                          for i in range(start, min(start + BATCH_SIZE, count))]
+                await session.execute_many(query=query, values=values)
+
+
+async def seed_memory(books_count: int, users_count: int, librarians_count: int):
+    """Same data set as seed(), written through crud functions into the in-memory engine"""
+    password_hash = bcrypt.hash(BENCH_PASSWORD)
+    session = memory.storage
+    ids = {}
+    for table, count, insert in (('authors', 200, db_misc.get_or_insert_author),
+                                 ('genres', 20, db_misc.get_or_insert_genre),
+                                 ('publishers', 50, db_misc.get_or_insert_publisher)):
+        ids[table] = [(await insert(f'{BENCH_PREFIX}-{table}-{i}', session)).id for i in range(count)]
+    for i in range(books_count):
+        await db_book.insert_book(books.NewBookData(
+            name=f'{BENCH_PREFIX}-book-{i}', author='', publisher='', genre='',
+            author_id=random.choice(ids['authors']), publisher_id=random.choice(ids['publishers']),
+            genre_id=random.choice(ids['genres'])), session)
+    for role, count in (('user', users_count), ('librarian', librarians_count)):
+        for i in range(count):
+            await db_user.insert_user(users.NewUserData(
+                email=f'{BENCH_PREFIX}-{role}-{i}@example.com', login=f'{BENCH_PREFIX}-{role}-{i}',
+                password=password_hash, role=role), session)
+
+
+def memory_fixture_ids() -> dict:
+    storage = memory.storage
+    fixture = {'books': sorted(storage.books)}
+    for role in ('user', 'librarian'):
+        fixture[role] = [(row['id'], row['login']) for row in storage.users.values() if row['role'] == role]
+    for table in ('authors', 'genres', 'publishers'):
+        fixture[table] = sorted(storage.names[table])
+    return fixture
+
+
+def start_in_process_server(port: int) -> uvicorn.Server:
+    """Serves the app from a background thread of this process"""
+    from app.main import app
+    server = uvicorn.Server(uvicorn.Config(app, host='127.0.0.1', port=port, log_level='warning'))
+    threading.Thread(target=server.run, daemon=True).start()
+    while not server.started:
+        time.sleep(0.05)
+    return server
+
+
+async def load_fixture_ids() -> dict:
+    """Returns ids of seeded books and users used to build requests"""
+    async with Database(postgre_url) as db, db.connection() as session:
+        fixture = {}
+        rows = await session.fetch_all(f'''SELECT id FROM books WHERE name LIKE '{BENCH_PREFIX}-%';''')
+        fixture['books'] = [row[0] for row in rows]
+        for role in ('user', 'librarian'):
+            rows = await session.fetch_all(
+                f'''SELECT id, login FROM users WHERE login LIKE '{BENCH_PREFIX}-{role}-%';''')
+            fixture[role] = [(row[0], row[1]) for row in rows]
+        for table in ('authors', 'genres', 'publishers'):
+            rows = await session.fetch_all(f'''SELECT id FROM {table} WHERE name LIKE '{BENCH_PREFIX}-%';''')
+            fixture[table] = [row[0] for row in rows]
+    return fixture
+
+
+class Recorder:
+    """Thread-safe storage of per-endpoint latencies and errors"""
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.latencies = defaultdict(list)
+        self.errors = defaultdict(int)
+
+    def record(self, endpoint: str, latency: float, ok: bool):
+        with self.lock:
+            self.latencies[endpoint].append(latency)
+            if not ok:
+                self.errors[endpoint] += 1
+
+
+def timed(recorder: Recorder, endpoint: str, http: requests.Session, method: str, url: str, **kwargs):
+    start = time.perf_counter()
+    try:
+        response = http.request(method, url, timeout=30, **kwargs)
+        ok = response.status_code < 500
+    except requests.RequestException:
+        response, ok = None, False
+    recorder.record(endpoint, time.perf_counter() - start, ok)
+    return response
+
+
+def login(recorder: Recorder, http: requests.Session, base_url: str, user_login: str) -> str | None:
+    response = timed(recorder, 'POST /authorization/token', http, 'POST', f'{base_url}/authorization/token',
+                     data={'username': user_login, 'password': BENCH_PASSWORD})
+    if response is None or response.status_code != 200:
+        return
+    return response.json()['access_token']
+
+
+def worker(base_url: str, fixture: dict, mix: dict, deadline: float, recorder: Recorder, seed_value: int):
+    """Runs randomly chosen scenarios until deadline"""
+    rnd = random.Random(seed_value)
+    http = requests.Session()
+    user_id, user_login = rnd.choice(fixture['user'])
+    _, librarian_login = rnd.choice(fixture['librarian'])
+    user_headers = {'Authorization': f'Bearer {login(recorder, http, base_url, user_login)}'}
+    librarian_headers = {'Authorization': f'Bearer {login(recorder, http, base_url, librarian_login)}'}
+    scenarios = list(mix)
+    weights = [mix[name] for name in scenarios]
+    while time.monotonic() < deadline:
+        scenario = rnd.choices(scenarios, weights)[0]
+        book_id = rnd.choice(fixture['books'])
+        if scenario == 'books_list':
+            timed(recorder, 'GET /api/v1/books/', http, 'GET', f'{base_url}/api/v1/books/')
+        elif scenario == 'book_get':
+            timed(recorder, 'GET /api/v1/books/{book_id}', http, 'GET', f'{base_url}/api/v1/books/{book_id}')
+        elif scenario == 'books_filter':
+            kind = rnd.choice(('genre', 'author', 'publisher'))
+            filter_id = rnd.choice(fixture[f'{kind}s'])
+            timed(recorder, f'GET /api/v1/books/{kind}/{{{kind}_id}}', http, 'GET',
+                  f'{base_url}/api/v1/books/{kind}/{filter_id}')
+        elif scenario == 'login':
+            login(recorder, http, base_url, user_login)
+        elif scenario == 'reserve':
+            timed(recorder, 'GET /api/v1/user/reserve_book/{book_id}', http, 'GET',
+                  f'{base_url}/api/v1/user/reserve_book/{book_id}', headers=user_headers)
+            timed(recorder, 'GET /api/v1/user/unreserve_book/{book_id}', http, 'GET',
+                  f'{base_url}/api/v1/user/unreserve_book/{book_id}', headers=user_headers)
+        elif scenario == 'give_take':
+            timed(recorder, 'GET /api/v1/librarian/give_book', http, 'GET',
+                  f'{base_url}/api/v1/librarian/give_book', headers=librarian_headers,
+                  json={'book_id': book_id, 'user_id': user_id})
+            timed(recorder, 'GET /api/v1/librarian/take_book', http, 'GET',
+                  f'{base_url}/api/v1/librarian/take_book', headers=librarian_headers,
+                  json={'book_id': book_id})
+
+
+def percentile(sorted_values: list[float], fraction: float) -> float:
+    if not sorted_values:
+        return 0.0
+    index = min(len(sorted_values) - 1, max(0, round(fraction * len(sorted_values)) - 1))
+    return sorted_values[index]
+
+
+def summarize(recorder: Recorder, duration: float) -> dict:
+    summary = {}
+    for endpoint, latencies in sorted(recorder.latencies.items()):
+        latencies = sorted(latencies)
+        summary[endpoint] = {
+            'requests': len(latencies),
+            'errors': recorder.errors[endpoint],
+            'throughput_rps': round(len(latencies) / duration, 2),
+            'mean_ms': round(sum(latencies) / len(latencies) * 1000, 3),
+            'p50_ms': round(percentile(latencies, 0.50) * 1000, 3),
+            'p95_ms': round(percentile(latencies, 0.95) * 1000, 3),
+            'p99_ms': round(percentile(latencies, 0.99) * 1000, 3),
+        }
+    return summary
+
+
+def current_commit() -> str | None:
+    try:
+        return subprocess.check_output(['git', 'rev-parse', 'HEAD'], text=True, stderr=subprocess.DEVNULL).strip()
+    except (OSError, subprocess.CalledProcessError):
+        return
+
+
+DEFAULT_MIX = {'books_list': 1, 'book_get': 10, 'books_filter': 3, 'login': 1, 'reserve': 2, 'give_take': 2}
+
+
+def run(base_url: str, duration: float, concurrency: int, mix: dict, seed_value: int) -> dict:
+    """
+    Drives the server with the given scenario mix
+    :param base_url: server address
+    :param duration: seconds to run
+    :param concurrency: number of concurrent clients
+    :param mix: scenario name -> relative weight
+    :param seed_value: random seed for reproducible request sequences
+    :return: results dict ready to be dumped as JSON
+    """
+    if settings.STORAGE_BACKEND == 'memory':
+        fixture = memory_fixture_ids()
+    else:
+        fixture = asyncio.run(load_fixture_ids())
+    if not (fixture['books'] and fixture['user'] and fixture['librarian']):
+        raise SystemExit('Database is not seeded, run the "seed" command first')
+    recorder = Recorder()
+    start = time.monotonic()
+    deadline = start + duration
+    with ThreadPoolExecutor(max_workers=concurrency) as executor:
+        futures = [executor.submit(worker, base_url, fixture, mix, deadline, recorder, seed_value + i)
+                   for i in range(concurrency)]
+        for future in futures:
+            future.result()
+    elapsed = time.monotonic() - start
+    return {
+        'commit': current_commit(),
+        'timestamp': int(time.time()),
+        'config': {'url': base_url, 'storage': settings.STORAGE_BACKEND, 'duration': duration, 'concurrency': concurrency, 'mix': mix,
+                   'seed': seed_value, 'books': len(fixture['books']), 'users': len(fixture['user'])},
+        'elapsed': round(elapsed, 3),
+        'endpoints': summarize(recorder, elapsed),
+    }
+
+
+def compare(baseline: dict, current: dict, threshold: float) -> bool:
+    """
+    Prints per-endpoint deltas between two result files
+    :return: True if no endpoint p95 latency or throughput regressed beyond threshold
+    """
+    passed = True
+    print(f'{"endpoint":55} {"p95 base":>10} {"p95 new":>10} {"rps base":>10} {"rps new":>10}')
+    for endpoint, new in current['endpoints'].items():
+        old = baseline['endpoints'].get(endpoint)
+        if not old:
+            print(f'{endpoint:55} {"-":>10} {new["p95_ms"]:>10} {"-":>10} {new["throughput_rps"]:>10}')
+            continue
+        regressed = (new['p95_ms'] > old['p95_ms'] * (1 + threshold)
+                     or new['throughput_rps'] < old['throughput_rps'] * (1 - threshold))
+        passed = passed and not regressed
+        print(f'{endpoint:55} {old["p95_ms"]:>10} {new["p95_ms"]:>10} '
+              f'{old["throughput_rps"]:>10} {new["throughput_rps"]:>10}{"  REGRESSION" if regressed else ""}')
+    return passed
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    commands = parser.add_subparsers(dest='command', required=True)
+    seed_parser = commands.add_parser('seed')
+    seed_parser.add_argument('--books', type=int, default=10000)
+    seed_parser.add_argument('--users', type=int, default=1000)
+    seed_parser.add_argument('--librarians', type=int, default=20)
+    seed_parser.add_argument('--reset', action='store_true')
+    run_parser = commands.add_parser('run')
+    run_parser.add_argument('--url', default='http://0.0.0.0:8000')
+    run_parser.add_argument('--duration', type=float, default=30)
+    run_parser.add_argument('--concurrency', type=int, default=32)
+    run_parser.add_argument('--mix', type=json.loads, default=DEFAULT_MIX,
+                            help=f'JSON scenario weights, default {json.dumps(DEFAULT_MIX)}')
+    run_parser.add_argument('--seed', type=int, default=0)
+    run_parser.add_argument('--output', default='bench_output.json')
+    run_parser.add_argument('--books', type=int, default=10000, help='catalogue size for STORAGE_BACKEND=memory')
+    run_parser.add_argument('--users', type=int, default=1000, help='users count for STORAGE_BACKEND=memory')
+    run_parser.add_argument('--librarians', type=int, default=20, help='librarians count for STORAGE_BACKEND=memory')
+    run_parser.add_argument('--port', type=int, default=8765, help='in-process server port for STORAGE_BACKEND=memory')
+    compare_parser = commands.add_parser('compare')
+    compare_parser.add_argument('baseline')
+    compare_parser.add_argument('current')
+    compare_parser.add_argument('--threshold', type=float, default=0.1)
+    args = parser.parse_args()
+
+    if args.command == 'seed':
+        random.seed(0)
+        asyncio.run(seed(args.books, args.users, args.librarians, args.reset))
+    elif args.command == 'run':
+        server = None
+        if settings.STORAGE_BACKEND == 'memory':
+            random.seed(0)
+            asyncio.run(seed_memory(args.books, args.users, args.librarians))
+            server = start_in_process_server(args.port)
+            args.url = f'http://127.0.0.1:{args.port}'
+        result = run(args.url, args.duration, args.concurrency, args.mix, args.seed)
+        if server is not None:
+            server.should_exit = True
+        with open(args.output, 'w') as file:
+            json.dump(result, file, indent=2)
+        for endpoint, stats in result['endpoints'].items():
+            print(f'{endpoint:55} {stats["throughput_rps"]:>9} rps  p50 {stats["p50_ms"]:>8} ms  '
+                  f'p95 {stats["p95_ms"]:>8} ms  p99 {stats["p99_ms"]:>8} ms  errors {stats["errors"]}')
+    elif args.command == 'compare':
+        with open(args.baseline) as file:
+            baseline = json.load(file)
+        with open(args.current) as file:
+            current = json.load(file)
+        sys.exit(0 if compare(baseline, current, args.threshold) else 1)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,83 @@
+"""
+Per-query overhead of the `databases` path versus the native asyncpg fast path used by hot crud calls.
+
+Runs every query sequentially on one connection, so the numbers show client-side overhead
+(query compilation, Record wrapping, model building) plus one round trip, not server throughput.
+
+Usage:
+    python -m benchmarks.query_overhead --iterations 5000 --output query_overhead.json
+"""
+import argparse
+import asyncio
+import json
+import time
+from databases.core import Database
+from app.settings import postgre_url
+from app.crud import book as db_book
+from app.crud import user as db_user
+from app.schemas import books, users
+
+
+async def measure(func, iterations: int) -> float:
+    """Returns mean microseconds per call after a warm-up"""
+    for _ in range(min(100, iterations)):
+        await func()
+    start = time.perf_counter()
+    for _ in range(iterations):
+        await func()
+    return (time.perf_counter() - start) / iterations * 1_000_000
+
+
+async def run(iterations: int) -> dict:
+    async with Database(postgre_url) as db, db.connection() as session:
+        book_id = await session.fetch_val('''SELECT id FROM books ORDER BY id LIMIT 1;''')
+        login = await session.fetch_val('''SELECT login FROM users ORDER BY id LIMIT 1;''')
+        genre_id = await session.fetch_val('''SELECT genre_id FROM books WHERE genre_id IS NOT NULL LIMIT 1;''')
+        if book_id is None or login is None:
+            raise SystemExit('Database is empty, run "python -m benchmarks.load_test seed" first')
+
+        async def databases_book():
+            result = await session.fetch_one(query='''SELECT * FROM books WHERE id = :id''', values={'id': book_id})
+            return books.Book.from_orm(result)
+
+        async def databases_user():
+            result = await session.fetch_one(query='''SELECT * FROM users WHERE login = :login;''',
+                                             values={'login': login})
+            return users.User.from_orm(result)
+
+        async def databases_search():
+            result = await session.fetch_all(query='''SELECT * FROM books WHERE genre_id = :value;''',
+                                             values={'value': genre_id})
+            return [books.Book.from_orm(item) for item in result]
+
+        # __wrapped__ skips single-flight so only the query path is measured
+        cases = {
+            'get_book_by_id': (databases_book, lambda: db_book.get_book_by_id.__wrapped__(book_id, session)),
+            'get_user_by_login': (databases_user, lambda: db_user.get_user_by_login.__wrapped__(login, session)),
+            'search_books': (databases_search, lambda: db_book.search_books.__wrapped__(
+                session, filter_name='genre_id', filter_value=genre_id)),
+        }
+        results = {}
+        for name, (before, after) in cases.items():
+            before_us = await measure(before, iterations)
+            after_us = await measure(after, iterations)
+            results[name] = {'databases_us': round(before_us, 2), 'asyncpg_us': round(after_us, 2),
+                             'speedup': round(before_us / after_us, 2)}
+    return {'iterations': iterations, 'timestamp': int(time.time()), 'queries': results}
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--iterations', type=int, default=5000)
+    parser.add_argument('--output', default='query_overhead.json')
+    args = parser.parse_args()
+    result = asyncio.run(run(args.iterations))
+    with open(args.output, 'w') as file:
+        json.dump(result, file, indent=2)
+    for name, stats in result['queries'].items():
+        print(f'{name:20} databases {stats["databases_us"]:>9} us  asyncpg {stats["asyncpg_us"]:>9} us  '
+              f'x{stats["speedup"]}')
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,12 @@
+"""Multi-worker run mode: gunicorn master with uvicorn workers.
+Send SIGHUP to the master for a graceful restart of all workers."""
+from app import settings
+
+bind = '0.0.0.0:8000'
+workers = settings.WEB_WORKERS
+worker_class = 'uvicorn.workers.UvicornWorker'
+graceful_timeout = 30
+timeout = 60
+keepalive = 5
+max_requests = 10000
+max_requests_jitter = 1000
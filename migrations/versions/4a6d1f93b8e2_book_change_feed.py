@@ -0,0 +1,43 @@
+"""book change feed
+
+Revision ID: 4a6d1f93b8e2
+Revises: e2b94f6a7c15
+Create Date: 2026-10-19 17:41:09.352871
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '4a6d1f93b8e2'
+down_revision = 'e2b94f6a7c15'
+branch_labels = None
+depends_on = None
+
+
+def upgrade() -> None:
+    op.execute(sa.schema.CreateSequence(sa.Sequence('book_changes_seq')))
+    # existing books get sequence values in id order, so the first sync returns them all
+    op.add_column('books', sa.Column('change_seq', sa.BigInteger(), nullable=True))
+    op.execute('''UPDATE books SET change_seq = ordered.seq
+    FROM (SELECT id, nextval('book_changes_seq') AS seq FROM (SELECT id FROM books ORDER BY id) ids) ordered
+    WHERE books.id = ordered.id;''')
+    op.alter_column('books', 'change_seq', nullable=False,
+                    server_default=sa.text("nextval('book_changes_seq'::regclass)"))
+    op.create_index(op.f('ix_books_change_seq'), 'books', ['change_seq'], unique=False)
+    op.create_table('book_tombstones',
+    sa.Column('book_id', sa.Integer(), nullable=False),
+    sa.Column('change_seq', sa.BigInteger(), server_default=sa.text("nextval('book_changes_seq'::regclass)"),
+              nullable=False),
+    sa.PrimaryKeyConstraint('book_id')
+    )
+    op.create_index(op.f('ix_book_tombstones_change_seq'), 'book_tombstones', ['change_seq'], unique=False)
+
+
+def downgrade() -> None:
+    op.drop_index(op.f('ix_book_tombstones_change_seq'), table_name='book_tombstones')
+    op.drop_table('book_tombstones')
+    op.drop_index(op.f('ix_books_change_seq'), table_name='books')
+    op.drop_column('books', 'change_seq')
+    op.execute(sa.schema.DropSequence(sa.Sequence('book_changes_seq')))
@@ -0,0 +1,33 @@
+"""book change writer transaction id
+
+Revision ID: b5e8c2a04d71
+Revises: 4a6d1f93b8e2
+Create Date: 2026-10-20 10:14:52.603117
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'b5e8c2a04d71'
+down_revision = '4a6d1f93b8e2'
+branch_labels = None
+depends_on = None
+
+TABLES = ('books', 'book_tombstones')
+
+
+def upgrade() -> None:
+    # existing rows get the id of this migration transaction, committed before any reader starts
+    for table in TABLES:
+        op.execute(f'''ALTER TABLE {table} ADD COLUMN change_xid xid8 NOT NULL DEFAULT pg_current_xact_id();''')
+        op.drop_index(op.f(f'ix_{table}_change_seq'), table_name=table)
+        op.create_index(f'ix_{table}_change_xid_seq', table, ['change_xid', 'change_seq'], unique=False)
+
+
+def downgrade() -> None:
+    for table in TABLES:
+        op.drop_index(f'ix_{table}_change_xid_seq', table_name=table)
+        op.create_index(op.f(f'ix_{table}_change_seq'), table, ['change_seq'], unique=False)
+        op.drop_column(table, 'change_xid')
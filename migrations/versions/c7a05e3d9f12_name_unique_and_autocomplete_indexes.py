@@ -0,0 +1,57 @@
+"""name unique and autocomplete indexes
+
+Revision ID: c7a05e3d9f12
+Revises: 8d41e7c0b2f3
+Create Date: 2026-10-19 12:20:05.640317
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'c7a05e3d9f12'
+down_revision = '8d41e7c0b2f3'
+branch_labels = None
+depends_on = None
+
+TABLES = ('authors', 'genres', 'publishers')
+
+
+def merge_duplicate_names(table: str):
+    # the old get-or-insert could add a name twice: books and facet counters move to the lowest id
+    column = f'{table[:-1]}_id'
+    op.execute(f'''CREATE TEMPORARY TABLE {table}_merges AS
+    SELECT id, keep_id FROM (SELECT id, MIN(id) OVER (PARTITION BY name) AS keep_id FROM {table}
+    WHERE name IS NOT NULL) names WHERE id <> keep_id;''')
+    op.execute(f'''UPDATE books SET {column} = m.keep_id FROM {table}_merges m WHERE books.{column} = m.id;''')
+    op.execute(f'''INSERT INTO book_facets (facet, value_id, count)
+    SELECT '{column}', m.keep_id, SUM(f.count) FROM book_facets f JOIN {table}_merges m
+    ON f.facet = '{column}' AND f.value_id = m.id GROUP BY m.keep_id
+    ON CONFLICT (facet, value_id) DO UPDATE SET count = book_facets.count + EXCLUDED.count;''')
+    op.execute(f'''DELETE FROM book_facets f USING {table}_merges m
+    WHERE f.facet = '{column}' AND f.value_id = m.id;''')
+    op.execute(f'''DELETE FROM {table} t USING {table}_merges m WHERE t.id = m.id;''')
+    op.execute(f'''DROP TABLE {table}_merges;''')
+
+
+def upgrade() -> None:
+    op.execute('CREATE EXTENSION IF NOT EXISTS pg_trgm')
+    connection = op.get_bind()
+    for table in TABLES:
+        merge_duplicate_names(table)
+        # databases bootstrapped by the app already have the constraint and indexes under these names
+        exists = connection.execute(sa.text('''SELECT 1 FROM pg_constraint
+        WHERE conname = :name AND conrelid = CAST(:table AS regclass);'''),
+                                    {'name': f'{table}_name_key', 'table': table}).scalar()
+        if not exists:
+            op.create_unique_constraint(f'{table}_name_key', table, ['name'])
+        op.execute(f'''CREATE INDEX IF NOT EXISTS ix_{table}_name_prefix ON {table} (lower(name) text_pattern_ops);''')
+        op.execute(f'''CREATE INDEX IF NOT EXISTS ix_{table}_name_trgm ON {table} USING gin (name gin_trgm_ops);''')
+
+
+def downgrade() -> None:
+    for table in TABLES:
+        op.drop_index(f'ix_{table}_name_trgm', table_name=table)
+        op.drop_index(f'ix_{table}_name_prefix', table_name=table)
+        op.drop_constraint(f'{table}_name_key', table, type_='unique')
@@ -0,0 +1,29 @@
+"""books loan and due dates
+
+Revision ID: e2b94f6a7c15
+Revises: c7a05e3d9f12
+Create Date: 2026-10-19 15:02:37.118204
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'e2b94f6a7c15'
+down_revision = 'c7a05e3d9f12'
+branch_labels = None
+depends_on = None
+
+
+def upgrade() -> None:
+    op.add_column('books', sa.Column('loaned_datetime', sa.Integer(), nullable=True))
+    op.add_column('books', sa.Column('due_datetime', sa.Integer(), nullable=True))
+    op.create_index('ix_books_due_outstanding', 'books', ['due_datetime'], unique=False,
+                    postgresql_where=sa.text('in_stock = false'))
+
+
+def downgrade() -> None:
+    op.drop_index('ix_books_due_outstanding', table_name='books')
+    op.drop_column('books', 'due_datetime')
+    op.drop_column('books', 'loaned_datetime')
@@ -0,0 +1,55 @@
+"""
+Storage tests run every scenario against MemoryStorage and, when TEST_DATABASE_URL points to
+a disposable database, against Postgres too. Without it the Postgres cases are skipped
+"""
+import os
+from contextlib import asynccontextmanager
+import pytest
+from databases import Database
+from app.crud.memory import MemoryStorage
+from app.db.start_database import create_tables
+
+
+TEST_DATABASE_URL = os.environ.get('TEST_DATABASE_URL')
+TABLES = 'books, book_tombstones, book_facets, users, genres, authors, publishers'
+
+
+@asynccontextmanager
+async def memory_backend():
+    storage = MemoryStorage()
+
+    @asynccontextmanager
+    async def connect():
+        yield storage
+    yield connect
+
+
+@asynccontextmanager
+async def postgres_backend():
+    database = Database(TEST_DATABASE_URL, min_size=1, max_size=4)
+    await database.connect()
+    try:
+        async with database.connection() as session:
+            await create_tables(session)
+            await session.execute(f'''TRUNCATE {TABLES} RESTART IDENTITY;''')
+
+        @asynccontextmanager
+        async def connect():
+            # one connection per task, run concurrent callers with a fresh contextvars.Context
+            async with database.connection() as session:
+                yield session
+        yield connect
+    finally:
+        await database.disconnect()
+
+
+@pytest.fixture(params=['memory', 'postgres'])
+def backend(request):
+    """
+    Async context manager factory, yields connect() giving sessions of a fresh empty storage
+    """
+    if request.param == 'postgres':
+        if not TEST_DATABASE_URL:
+            pytest.skip('TEST_DATABASE_URL is not set')
+        return postgres_backend
+    return memory_backend
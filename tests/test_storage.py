@@ -0,0 +1,191 @@
+import asyncio
+import contextvars
+from time import time
+import pytest
+from asyncpg.exceptions import UniqueViolationError
+from app import settings
+from app.crud import book as db_book
+from app.crud import misc as db_misc
+from app.crud import user as db_user
+from app.schemas import books, users
+from tests.conftest import TEST_DATABASE_URL, postgres_backend
+
+
+async def add_book(session, name: str, genre: str = 'Novel', author: str = 'Author',
+                   publisher: str = 'Publisher') -> books.Book:
+    new_book = books.NewBookData(name=name, author=author, publisher=publisher, genre=genre)
+    new_book.author_id = (await db_misc.get_or_insert_author(author, session)).id
+    new_book.genre_id = (await db_misc.get_or_insert_genre(genre, session)).id
+    new_book.publisher_id = (await db_misc.get_or_insert_publisher(publisher, session)).id
+    await db_book.insert_book(new_book, session)
+    return await db_book.get_book_by_name(name, session)
+
+
+def new_user(login: str) -> users.NewUserData:
+    return users.NewUserData(email=f'{login}@example.com', login=login, password='hash', role='user')
+
+
+async def genre_counts(session) -> dict[str, int]:
+    facets = await db_book.get_facets(session)
+    return {item.name: item.count for item in facets.genres}
+
+
+async def feed(session, since: tuple[int, int], limit: int = 100) -> books.BookChanges:
+    return await db_book.get_book_changes(since, limit, session)
+
+
+def test_book_name_is_unique(backend):
+    async def scenario():
+        async with backend() as connect, connect() as session:
+            await add_book(session, 'Dune')
+            other = await add_book(session, 'Emma')
+            with pytest.raises(UniqueViolationError):
+                await add_book(session, 'Dune')
+            other.name = 'Dune'
+            with pytest.raises(UniqueViolationError):
+                await db_book.update_book(other, session)
+            assert (await db_book.get_book_by_id(other.id, session)).name == 'Emma'
+    asyncio.run(scenario())
+
+
+def test_login_is_unique(backend):
+    async def scenario():
+        async with backend() as connect, connect() as session:
+            await db_user.insert_user(new_user('alice'), session)
+            with pytest.raises(UniqueViolationError):
+                await db_user.insert_user(new_user('alice'), session)
+            inserted = await db_user.insert_users([new_user('alice'), new_user('bob')], session)
+            assert inserted == {'bob'}
+            assert await db_user.get_existing_logins(['alice', 'bob', 'carol'], session) == {'alice', 'bob'}
+    asyncio.run(scenario())
+
+
+def test_get_or_insert_name_returns_existing(backend):
+    async def scenario():
+        async with backend() as connect, connect() as session:
+            first = await db_misc.get_or_insert_genre('Poetry', session)
+            assert (await db_misc.get_or_insert_genre('Poetry', session)).id == first.id
+            assert (await db_misc.get_or_insert_genre('Drama', session)).id != first.id
+    asyncio.run(scenario())
+
+
+def test_facets_follow_writes(backend):
+    async def scenario():
+        async with backend() as connect, connect() as session:
+            dune = await add_book(session, 'Dune', genre='Sci-Fi')
+            await add_book(session, 'Solaris', genre='Sci-Fi')
+            hamlet = await add_book(session, 'Hamlet', genre='Drama')
+            assert await genre_counts(session) == {'Sci-Fi': 2, 'Drama': 1}
+            assert (await db_book.get_facets(session)).in_stock == 3
+
+            dune.in_stock = False
+            await db_book.update_book(dune, session)
+            facets = await db_book.get_facets(session)
+            assert (facets.in_stock, facets.given_out) == (2, 1)
+
+            hamlet.genre_id = dune.genre_id
+            await db_book.update_book(hamlet, session)
+            assert await genre_counts(session) == {'Sci-Fi': 3}
+
+            await db_book.delete_book(dune.id, session)
+            facets = await db_book.get_facets(session)
+            assert await genre_counts(session) == {'Sci-Fi': 2}
+            assert (facets.in_stock, facets.given_out) == (2, 0)
+    asyncio.run(scenario())
+
+
+@pytest.mark.skipif(not TEST_DATABASE_URL, reason='TEST_DATABASE_URL is not set')
+def test_facets_are_rebuilt_when_created_empty():
+    async def scenario():
+        async with postgres_backend() as connect, connect() as session:
+            dune = await add_book(session, 'Dune', genre='Sci-Fi')
+            await add_book(session, 'Emma')
+            assert not await db_book.ensure_facets(session)
+            # book_facets created by create_all next to existing books, then written with deltas
+            await session.execute('''DELETE FROM book_facets;''')
+            dune.in_stock = False
+            await db_book.update_book(dune, session)
+            assert await db_book.ensure_facets(session)
+            facets = await db_book.get_facets(session)
+            assert (facets.in_stock, facets.given_out) == (1, 1)
+            assert await genre_counts(session) == {'Sci-Fi': 1, 'Novel': 1}
+            assert not await db_book.ensure_facets(session)
+    asyncio.run(scenario())
+
+
+def test_change_feed_pages_updates_and_deletes(backend):
+    async def scenario():
+        async with backend() as connect, connect() as session:
+            added = [await add_book(session, name) for name in ('Dune', 'Emma', 'Ulysses')]
+
+            first_page = await feed(session, (0, 0), limit=2)
+            assert [change.id for change in first_page.changes] == [book.id for book in added[:2]]
+            assert first_page.has_more
+            second_page = await feed(session, books.BookChanges.parse_cursor(first_page.next_cursor), limit=2)
+            assert [change.id for change in second_page.changes] == [added[2].id]
+            assert not second_page.has_more
+
+            cursor = books.BookChanges.parse_cursor(second_page.next_cursor)
+            assert (await feed(session, cursor)).changes == []
+            assert (await feed(session, cursor)).next_cursor == second_page.next_cursor
+
+            added[0].name = 'Dune Messiah'
+            await db_book.update_book(added[0], session)
+            await db_book.delete_book(added[1].id, session)
+            changes = (await feed(session, cursor)).changes
+            assert [(change.id, change.deleted) for change in changes] == [(added[0].id, False), (added[1].id, True)]
+            assert changes[0].book.name == 'Dune Messiah'
+            assert changes[1].book is None
+
+            # a full resync sees every book once, in its latest state
+            changes = (await feed(session, (0, 0))).changes
+            assert [(change.id, change.deleted) for change in changes] == \
+                   [(added[2].id, False), (added[0].id, False), (added[1].id, True)]
+    asyncio.run(scenario())
+
+
+def test_concurrent_reservations_have_one_winner(backend):
+    async def scenario():
+        async with backend() as connect:
+            async with connect() as session:
+                book = await add_book(session, 'Dune')
+            now = int(time())
+
+            async def reserve(user_id: int) -> bool:
+                async with connect() as session:
+                    return await db_book.reserve_book(book.id, user_id, now, session)
+
+            # a fresh context per patron gives each of them its own connection
+            tasks = [asyncio.create_task(reserve(user_id), context=contextvars.Context()) for user_id in range(1, 9)]
+            results = await asyncio.gather(*tasks)
+            assert results.count(True) == 1
+            async with connect() as session:
+                reserved = await db_book.get_book_by_id(book.id, session)
+            assert reserved.reserved_user_id == results.index(True) + 1
+            assert reserved.reserved_datetime == now
+    asyncio.run(scenario())
+
+
+def test_reservation_conditions(backend):
+    async def scenario():
+        async with backend() as connect, connect() as session:
+            book = await add_book(session, 'Dune')
+            given_out = await add_book(session, 'Emma')
+            given_out.in_stock = False
+            await db_book.update_book(given_out, session)
+            now = int(time())
+            expired = now + settings.reservation_time
+
+            assert not await db_book.reserve_book(given_out.id, 1, now, session)
+            assert not await db_book.reserve_book(book.id + given_out.id, 1, now, session)
+            assert await db_book.reserve_book(book.id, 1, now, session)
+            assert not await db_book.reserve_book(book.id, 2, now, session)
+            assert not await db_book.unreserve_book(book.id, 2, now, session)
+
+            assert await db_book.unreserve_book(book.id, 1, now, session)
+            assert not await db_book.unreserve_book(book.id, 1, now, session)
+            assert await db_book.reserve_book(book.id, 2, now, session)
+            assert await db_book.reserve_book(book.id, 1, expired, session)
+            assert not await db_book.unreserve_book(book.id, 2, expired, session)
+            assert [item.id for item in await db_book.get_books_by_reserver(1, session)] == [book.id]
+    asyncio.run(scenario())